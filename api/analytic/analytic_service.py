@@ -1,108 +1,147 @@
+import asyncio
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+from backend.api.analytic.archive import EventArchive
+from backend.api.analytic.cohorts import activity_bitmaps
+from backend.api.analytic.dedup import event_deduplicator
+from backend.api.analytic.encoding import FIELD_KEYS, event_codec
+from backend.api.analytic.funnel import FunnelMatcher, merge_user_streams
+from backend.api.analytic.hot_window import HotWindow
+from backend.api.analytic.live import LiveCounters
+from backend.api.analytic.query_dsl import (
+    ENCODED_FIELDS,
+    MetadataIndexes,
+    compile_match,
+    group_pipeline,
+    metadata_index_name,
+    storage_key
+)
+from backend.api.analytic.sampling import SAMPLE_INDEX, SampleCoverage, estimate, exact, sample_filter
+from backend.api.analytic.sessions import SessionAggregator
+from backend.api.analytic.topk import TopKSketches
+from backend.api.analytic.watermark import IngestWatermark
+from backend.api.analytic.partitions import EventPartitions, month_start, partition_name
 from backend.utils.aiohttp_client import aiohttp_client_session
+from backend.utils.mongodb import ingest_write_concern
+from backend.utils.query_guard import AggregationLimiter, find_options, query_options
+from backend.utils.rate_limit import RateLimiter
 import logging
 
 from backend.utils.semaphore import semaphore
+from backend.utils.settings import get_settings
 
 log = logging.getLogger("analytic_server")
 
+GROUPABLE_FIELDS = {"event_name", "event_category", "source"}
+
+
 class AnalyticsService:
     """
     Business logic layer for analytics events & metrics
     """
 
-    @staticmethod
-    async def daily_events(filters: dict, db):
-        return await db.event.count_documents(filters)
+    # Indexes on every ``event_YYYYMM`` partition, declared next to the
+    # query shapes they serve. Keys are storage keys (see encoding.FIELD_KEYS).
+    EVENT_INDEXES = [
+        # count_events, daily_events, events_timeseries, list_events without
+        # filters; active_users is covered (user_id is read from the index).
+        IndexModel([("t", DESCENDING), ("u", ASCENDING)], name="t_-1_u_1"),
+        # list_events filtered by event_name; events_grouped_by event_name.
+        IndexModel([("n", ASCENDING), ("t", DESCENDING)], name="n_1_t_-1"),
+        # list_events filtered by user_id. Anonymous events are left out.
+        IndexModel(
+            [("u", ASCENDING), ("t", DESCENDING)],
+            name="u_1_t_-1",
+            partialFilterExpression={"u": {"$gt": ""}}
+        ),
+        # events_grouped_by event_category / source (covered).
+        IndexModel([("c", ASCENDING)], name="c_1"),
+        IndexModel([("src", ASCENDING)], name="src_1"),
+        # Idempotency keys of retried events; only keyed events are indexed.
+        IndexModel(
+            [("k", ASCENDING)],
+            name="k_1",
+            unique=True,
+            partialFilterExpression={"k": {"$exists": True}}
+        ),
+        # approx=true counts, timeseries and groupings over the h sample
+        # key (see sampling.py); covered for all three.
+        IndexModel(
+            [("h", ASCENDING), ("t", DESCENDING), ("n", ASCENDING), ("c", ASCENDING), ("src", ASCENDING)],
+            name=SAMPLE_INDEX
+        ),
+    ]
 
-    @staticmethod
-    async def create_event(event, db):
-        data = event.model_dump()
-        data["created_at"] = datetime.utcnow()
+    # Superseded by the compound indexes above or by the compact key names.
+    REDUNDANT_EVENT_INDEXES = [
+        "created_at_1", "event_name_1", "user_id_1",
+        "created_at_-1_user_id_1", "event_name_1_created_at_-1",
+        "user_id_1_created_at_-1", "event_category_1", "source_1",
+    ]
 
-        result = await db.event.insert_one(data)
-        return {"event_id": str(result.inserted_id)}
+    GROUP_BY_HINTS = {
+        "event_name": "n_1_t_-1",
+        "event_category": "c_1",
+        "source": "src_1",
+    }
+
+    ACTIVE_USER_RANGES = {
+        "day": timedelta(days=1),
+        "week": timedelta(days=7),
+        "month": timedelta(days=30),
+    }
 
     @staticmethod
-    async def list_events(
-        event_name: str | None,
+    def _list_events_query(
+        event_name_code: int | None,
         user_id: str | None,
         start_date: datetime | None,
-        end_date: datetime | None,
-        page: int,
-        limit: int,
-        db
-    ):
+        end_date: datetime | None
+    ) -> dict:
         query = {}
-        if event_name:
-            query["event_name"] = event_name
+        if event_name_code is not None:
+            query["n"] = event_name_code
         if user_id:
-            query["user_id"] = user_id
+            query["u"] = user_id
         if start_date or end_date:
-            query["created_at"] = {}
+            query["t"] = {}
             if start_date:
-                query["created_at"]["$gte"] = start_date
+                query["t"]["$gte"] = start_date
             if end_date:
-                query["created_at"]["$lte"] = end_date
-        cursor = (
-            db.event
-            .find(query)
-            .sort("created_at", -1)
-            .skip((page - 1) * limit)
-            .limit(limit)
-        )
-        events = await cursor.to_list(length=limit)
-        for e in events:
-            e["_id"] = str(e["_id"])
-        return events
+                query["t"]["$lte"] = end_date
+        return query
 
     @staticmethod
-    async def get_event(event_id: str, db):
-        event = await db.event.find_one({"_id": ObjectId(event_id)})
-        if not event:
-            return None
-        event["_id"] = str(event["_id"])
-        return event
-
-    @staticmethod
-    async def count_events(filters: dict, db):
-        return await db.event.count_documents(filters)
-
-    @staticmethod
-    async def events_grouped_by(field: str, db):
-        allowed_fields = {"event_name", "event_category", "source"}
-        if field not in allowed_fields:
-            raise ValueError(f"Invalid grouping field: {field}")
+    def _grouped_pipeline(field: str, limit: int | None = None) -> list[dict]:
         pipeline = [
             {
                 "$group": {
-                    "_id": f"${field}",
+                    "_id": f"${FIELD_KEYS[field]}",
                     "count": {"$sum": 1}
                 }
             },
             {"$sort": {"count": -1}}
         ]
-        results = await db.event.aggregate(pipeline).to_list(length=None)
-        return [
-            {
-                "key": r["_id"] or "unknown",
-                "count": r["count"]
-            }
-            for r in results
-        ]
+        if limit:
+            # Coalesced with $sort into a top-k sort that keeps only `limit` groups.
+            pipeline.append({"$limit": limit})
+        return pipeline
 
     @staticmethod
-    async def events_timeseries(interval: str, start: datetime, end: datetime, db):
+    def _timeseries_pipeline(interval: str, start: datetime, end: datetime) -> list[dict]:
         group_format = "%Y-%m-%d" if interval == "day" else "%Y-%m-%d %H"
-        pipeline = [
-            {"$match": {"created_at": {"$gte": start, "$lte": end}}},
+        return [
+            {"$match": {"t": {"$gte": start, "$lte": end}}},
             {
                 "$group": {
                     "_id": {
                         "$dateToString": {
                             "format": group_format,
-                            "date": "$created_at"
+                            "date": "$t"
                         }
                     },
                     "count": {"$sum": 1}
@@ -111,21 +150,566 @@ class AnalyticsService:
             {"$sort": {"_id": 1}}
         ]
 
-        results = await db.event.aggregate(pipeline).to_list(length=None)
+    @staticmethod
+    def _active_users_pipeline(start: datetime) -> list[dict]:
+        return [
+            {"$match": {"t": {"$gte": start}}},
+            {"$group": {"_id": "$u"}},
+            {"$count": "active_users"}
+        ]
+
+    @staticmethod
+    def query_shapes(collection: str, sample_event_name_code: int, sample_user_id: str) -> dict[str, dict]:
+        """
+        Representative ``explain`` commands for every query issued against
+        an event partition, used by the index advisor.
+        """
+        now = datetime.utcnow()
+        week_ago = now - timedelta(days=7)
+        day_ago = now - timedelta(days=1)
+
+        def find(query: dict) -> dict:
+            return {"find": collection, "filter": query, "sort": {"t": -1}, "limit": 20}
+
+        def aggregate(pipeline: list[dict], hint: str | None = None) -> dict:
+            command = {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+            if hint:
+                command["hint"] = hint
+            return command
+
+        shapes = {
+            "list_events": find({}),
+            "list_events_by_event_name": find(
+                AnalyticsService._list_events_query(sample_event_name_code, None, week_ago, now)
+            ),
+            "list_events_by_user_id": find(
+                AnalyticsService._list_events_query(None, sample_user_id, week_ago, now)
+            ),
+            "count_events": {"count": collection, "query": {"t": {"$gte": day_ago}}},
+            "events_timeseries": aggregate(
+                AnalyticsService._timeseries_pipeline("hour", week_ago, now)
+            ),
+            "active_users": aggregate(AnalyticsService._active_users_pipeline(week_ago)),
+        }
+        for field in sorted(GROUPABLE_FIELDS):
+            shapes[f"events_grouped_by_{field}"] = aggregate(
+                AnalyticsService._grouped_pipeline(field),
+                AnalyticsService.GROUP_BY_HINTS[field]
+            )
+        return shapes
+
+    @staticmethod
+    def _created_range(filters: dict) -> tuple[datetime | None, datetime | None]:
+        bounds = filters.get("created_at", {})
+        return bounds.get("$gte", bounds.get("$gt")), bounds.get("$lte", bounds.get("$lt"))
+
+    @staticmethod
+    async def daily_events(filters: dict, db):
+        return await AnalyticsService.count_events(filters, db)
+
+    @staticmethod
+    async def create_event(data: dict, db):
+        doc = await event_codec.encode(db, data)
+        collection = await event_partitions.ensure(db, doc["t"])
+        write_concern = ingest_write_concern()
+        if "k" in doc and not write_concern.acknowledged:
+            # Duplicates are only reported to acknowledged writes, and a
+            # duplicate must not reach the ingest-time aggregates below.
+            write_concern = WriteConcern(w=1)
+        try:
+            result = await collection.with_options(write_concern=write_concern).insert_one(doc)
+        except DuplicateKeyError:
+            event_deduplicator.record_index_duplicate()
+            log.info("Duplicate event dropped", extra={"idempotency_key": doc.get("k")})
+            return {"event_id": None, "duplicate": True}
+        ingest_watermark.advance()
+        hot_window.append(doc)
+        await activity_bitmaps.record(db, doc)
+        await session_aggregator.record(db, doc)
+        topk_sketches.record(doc)
+        live_counters.record(data["event_name"])
+        return {"event_id": str(result.inserted_id)}
+
+    @staticmethod
+    async def list_events(
+        event_name: str | None,
+        user_id: str | None,
+        start_date: datetime | None,
+        end_date: datetime | None,
+        page: int,
+        limit: int,
+        db
+    ):
+        event_name_code = None
+        if event_name:
+            event_name_code = await event_codec.lookup(db, "event_name", event_name)
+            if event_name_code is None:
+                return []
+        query = AnalyticsService._list_events_query(event_name_code, user_id, start_date, end_date)
+        collections = await event_partitions.collections_for_range(db, start_date, end_date)
+        skip = (page - 1) * limit
+        events = []
+        # Partitions are walked newest first, so concatenating them keeps the
+        # created_at DESC order. Partitions that fall entirely inside the
+        # skipped range are only counted, bounded by the number to skip.
+        for collection in collections:
+            if skip:
+                matched = await collection.count_documents(query, limit=skip + 1, **query_options())
+                if matched <= skip:
+                    skip -= matched
+                    continue
+            remaining = limit - len(events)
+            cursor = (
+                collection
+                .find(query, **find_options())
+                .sort("t", -1)
+                .skip(skip)
+                .limit(remaining)
+            )
+            events.extend(await cursor.to_list(length=remaining))
+            skip = 0
+            if len(events) >= limit:
+                break
+        if len(events) < limit:
+            # Archived days are older than every partition, so they come last.
+            events.extend(await event_archive.find(
+                db, event_name_code, user_id, start_date, end_date, skip, limit - len(events)
+            ))
+        return [await event_codec.decode(db, e) for e in events]
+
+    @staticmethod
+    async def get_event(event_id: str, db):
+        oid = ObjectId(event_id)
+        inserted_at = oid.generation_time
+        names = [partition_name(inserted_at)]
+        # created_at is taken when the request arrives, before the insert, so
+        # an event inserted right after midnight on the 1st may live one
+        # month back.
+        if inserted_at - month_start(inserted_at) < timedelta(minutes=5):
+            names.append(partition_name(month_start(inserted_at) - timedelta(days=1)))
+        for name in names:
+            event = await db[name].find_one({"_id": oid})
+            if event:
+                return await event_codec.decode(db, event)
+        return None
+
+    @staticmethod
+    async def count_events(filters: dict, db, sample_rate: float | None = None):
+        """
+        Number of events matching ``filters``. With ``sample_rate`` only the
+        sampled events are counted and an estimate with its 95% confidence
+        interval is returned instead (see sampling.estimate).
+        """
+        start, end = AnalyticsService._created_range(filters)
+        if set(filters) == {"created_at"} and start and hot_window.covers(start):
+            count = hot_window.count(start, end)
+            return count if sample_rate is None else exact(count)
+        collections = await event_partitions.collections_for_range(db, start, end)
+        query = event_codec.storage_filter(filters)
+        if sample_rate is None:
+            counts = await asyncio.gather(*(c.count_documents(query, **query_options()) for c in collections))
+            return sum(counts)
+        sampled_collections, exact_collections = await sample_coverage.split(collections)
+        sampled_query = {**query, **sample_filter(sample_rate)}
+        sampled, unsampled = await asyncio.gather(
+            asyncio.gather(*(
+                c.count_documents(sampled_query, hint=SAMPLE_INDEX, **query_options())
+                for c in sampled_collections
+            )),
+            asyncio.gather(*(c.count_documents(query, **query_options()) for c in exact_collections)),
+        )
+        return estimate(sum(sampled), sample_rate, sum(unsampled))
+
+    @staticmethod
+    async def events_grouped_by(field: str, db, limit: int | None = None, sample_rate: float | None = None):
+        if field not in GROUPABLE_FIELDS:
+            raise ValueError(f"Invalid grouping field: {field}")
+        collections = await event_partitions.collections_for_range(db, None, None)
+        archived = await event_archive.group_counts(db, FIELD_KEYS[field])
+        # Per-partition top-k is not exact once partials are summed, so
+        # $limit is only pushed down when a single partition is read.
+        single = len(collections) == 1 and not archived and sample_rate is None
+        pipeline = AnalyticsService._grouped_pipeline(field, limit if single else None)
+        hint = AnalyticsService.GROUP_BY_HINTS[field]
+        sampled_collections, exact_collections = [], collections
+        sampled_pipeline = pipeline
+        if sample_rate is not None:
+            sampled_collections, exact_collections = await sample_coverage.split(collections)
+            sampled_pipeline = [{"$match": sample_filter(sample_rate)}, *pipeline]
+        partials = await asyncio.gather(*(
+            c.aggregate(
+                sampled_pipeline,
+                hint=SAMPLE_INDEX,
+                **query_options()
+            ).to_list(length=None)
+            for c in sampled_collections
+        ), *(
+            c.aggregate(
+                pipeline,
+                hint=hint,
+                **query_options()
+            ).to_list(length=None)
+            for c in exact_collections
+        ))
+        sampled = Counter()
+        for results in partials[:len(sampled_collections)]:
+            for r in results:
+                sampled[r["_id"]] += r["count"]
+        # Partitions that cannot be sampled are counted exactly, like the archive.
+        for results in partials[len(sampled_collections):]:
+            for r in results:
+                archived[r["_id"]] += r["count"]
+        if sample_rate is None:
+            ranked = [
+                {"code": code, "count": count}
+                for code, count in (archived + sampled).most_common(limit)
+            ]
+        else:
+            # Archived counts are exact and added unscaled.
+            ranked = sorted(
+                (
+                    {"code": code, **estimate(sampled[code], sample_rate, archived[code])}
+                    for code in sampled.keys() | archived.keys()
+                ),
+                key=lambda r: r["count"],
+                reverse=True
+            )[:limit]
+        return [
+            {"key": await event_codec.value(db, field, r.pop("code")) or "unknown", **r}
+            for r in ranked
+        ]
+
+    @staticmethod
+    async def top_keys(field: str, start: datetime, end: datetime, n: int, db):
+        """
+        Approximate top ``n`` keys of a field from the hourly heavy-hitter
+        sketches, with upper (``count``) and lower bounds per key.
+        """
+        results = await TopKSketches.top(db, field, start, end, n)
+        for r in results:
+            if field == "user_id":
+                continue
+            r["key"] = await event_codec.value(db, field, r["key"]) or "unknown"
         return results
 
+    @staticmethod
+    async def events_timeseries(
+        interval: str,
+        start: datetime,
+        end: datetime,
+        db,
+        sample_rate: float | None = None
+    ):
+        if hot_window.covers(start):
+            series = hot_window.timeseries(interval, start, end)
+            if sample_rate is not None:
+                series = [{"_id": r["_id"], **exact(r["count"])} for r in series]
+            return series
+        pipeline = AnalyticsService._timeseries_pipeline(interval, start, end)
+        collections = await event_partitions.collections_for_range(db, start, end)
+        sampled_collections, exact_collections = [], collections
+        sampled_pipeline = pipeline
+        if sample_rate is not None:
+            sampled_collections, exact_collections = await sample_coverage.split(collections)
+            sampled_pipeline = [
+                {"$match": {**pipeline[0]["$match"], **sample_filter(sample_rate)}},
+                *pipeline[1:]
+            ]
+        partials = await asyncio.gather(*(
+            c.aggregate(sampled_pipeline, hint=SAMPLE_INDEX, **query_options()).to_list(length=None)
+            for c in sampled_collections
+        ), *(
+            c.aggregate(pipeline, **query_options()).to_list(length=None) for c in exact_collections
+        ))
+        archived = await event_archive.timeseries(db, interval, start, end)
+        sampled = Counter()
+        for results in partials[:len(sampled_collections)]:
+            for r in results:
+                sampled[r["_id"]] += r["count"]
+        # Partitions that cannot be sampled are counted exactly, like the archive.
+        for results in partials[len(sampled_collections):]:
+            for r in results:
+                archived[r["_id"]] += r["count"]
+        if sample_rate is None:
+            counts = archived + sampled
+            return [{"_id": bucket, "count": counts[bucket]} for bucket in sorted(counts)]
+        return [
+            {"_id": bucket, **estimate(sampled[bucket], sample_rate, archived[bucket])}
+            for bucket in sorted(sampled.keys() | archived.keys())
+        ]
+
 
     @staticmethod
     async def active_users(start: datetime, db):
-        pipeline = [
-            {"$match": {"created_at": {"$gte": start}}},
-            {"$group": {"_id": "$user_id"}},
-            {"$count": "active_users"}
+        if hot_window.covers(start):
+            return hot_window.active_users(start)
+        collections = await event_partitions.collections_for_range(db, start, None)
+        if not collections:
+            return 0
+        first, *rest = collections
+        # Users are de-duplicated per partition first, then across partitions
+        # with $unionWith, so the count stays a distinct count.
+        per_partition = AnalyticsService._active_users_pipeline(start)[:-1]
+        pipeline = per_partition + [
+            {"$unionWith": {"coll": c.name, "pipeline": per_partition}}
+            for c in rest
         ]
-
-        result = await db.event.aggregate(pipeline).to_list(length=1)
+        if rest:
+            pipeline.append({"$group": {"_id": "$_id"}})
+        pipeline.append({"$count": "active_users"})
+        result = await first.aggregate(pipeline, **query_options()).to_list(length=1)
         return result[0]["active_users"] if result else 0
 
+    @staticmethod
+    async def funnel(
+        steps: list[str],
+        window_seconds: int,
+        start: datetime,
+        end: datetime | None,
+        db
+    ):
+        """
+        Ordered conversion funnel, evaluated in one pass over the step events
+        sorted by user then time (served by the u_1_t_-1 index, scanned in
+        reverse). Anonymous events are not part of any funnel.
+        """
+        end = end or datetime.now(timezone.utc)
+        codes = [await event_codec.lookup(db, "event_name", step) for step in steps]
+        # Unknown event names can never match; -1 is not a valid code.
+        step_codes = [-1 if code is None else code for code in codes]
+        query = {
+            "u": {"$gt": ""},
+            "t": {"$gte": start, "$lte": end},
+            "n": {"$in": [code for code in step_codes if code != -1]},
+        }
+        collections = await event_partitions.collections_for_range(db, start, end)
+        cursors = [
+            c.find(query, {"_id": 0, "u": 1, "t": 1, "n": 1}, batch_size=10_000, **find_options())
+            .sort([("u", -1), ("t", 1)])
+            .hint("u_1_t_-1")
+            for c in collections
+        ]
+        matcher = FunnelMatcher(step_codes, window_seconds)
+        async for doc in merge_user_streams(cursors):
+            matcher.feed(doc["u"], doc["t"].timestamp(), doc["n"])
+        return matcher.result(steps)
+
+    @staticmethod
+    async def _check_query_cost(collections, match: dict, indexed_metadata: set[str]) -> None:
+        """
+        Reject a query whose index-served part alone matches more than
+        QUERY_MAX_DOCS_EXAMINED documents. The estimate counts, per
+        partition, the time range plus the first equality filter whose index
+        that partition has (metadata indexes only exist on partitions created
+        after them), hinted so it is answered from the index. It reads up to
+        QUERY_MAX_DOCS_EXAMINED index keys on top of the query itself.
+        """
+        cap = settings.QUERY_MAX_DOCS_EXAMINED
+        candidates = [("n", "n_1_t_-1"), ("u", "u_1_t_-1")] + [
+            (f"m.{key}", metadata_index_name(key)) for key in sorted(indexed_metadata)
+        ]
+        candidates = [(key, index) for key, index in candidates if "$eq" in match.get(key, {})]
+        # u_1_t_-1 only indexes non-empty user ids.
+        if not (isinstance(match.get("u", {}).get("$eq"), str) and match["u"]["$eq"]):
+            candidates = [(key, index) for key, index in candidates if key != "u"]
+        examined = 0
+        for collection in collections:
+            existing = await collection.index_information() if candidates else {}
+            estimate, hint = {"t": match["t"]}, "t_-1_u_1"
+            for key, index in candidates:
+                if index in existing:
+                    estimate[key], hint = match[key]["$eq"], index
+                    break
+            examined += await collection.count_documents(
+                estimate, limit=cap + 1 - examined, hint=hint, **query_options()
+            )
+            if examined > cap:
+                raise ValueError(
+                    f"Query would examine more than {cap} events; "
+                    "narrow the time range or filter on an indexed field"
+                )
+
+    @staticmethod
+    async def adhoc_query(query, db):
+        """
+        Filter and group events by top-level fields and whitelisted
+        metadata keys, within the configured cost limits.
+        """
+        metadata_keys = settings.METADATA_QUERY_KEYS
+        match, used_metadata = await compile_match(query.filters, metadata_keys, event_codec.lookup, db)
+        end = query.end or datetime.now(timezone.utc)
+        match["t"] = {"$gte": query.start, "$lte": end}
+        group_keys = [storage_key(field, metadata_keys) for field in query.group_by]
+        metadata_indexes.record_usage(db, used_metadata)
+
+        collections = await event_partitions.collections_for_range(db, query.start, end)
+        await AnalyticsService._check_query_cost(collections, match, metadata_indexes.indexed)
+        pipeline = group_pipeline(match, group_keys, query.limit if len(collections) == 1 else None)
+        partials = await asyncio.gather(*(
+            c.aggregate(pipeline, **query_options()).to_list(length=None)
+            for c in collections
+        ))
+        if not group_keys:
+            return {"count": sum(r["count"] for results in partials for r in results)}
+
+        counts = Counter()
+        for results in partials:
+            for r in results:
+                counts[tuple(r["_id"].get(f"g{i}") for i in range(len(group_keys)))] += r["count"]
+        groups = []
+        for values, count in counts.most_common(query.limit):
+            key = {}
+            for field, value in zip(query.group_by, values):
+                if field in ENCODED_FIELDS:
+                    value = await event_codec.value(db, field, value)
+                key[field] = value
+            groups.append({"key": key, "count": count})
+        return {"groups": groups}
+
+    @staticmethod
+    def _batch_key(item, now: datetime) -> tuple:
+        """
+        Normalized form of a batch item; items with equal keys are run once.
+        Range queries carry their start as the second element.
+        """
+        if item.type in ("count", "daily"):
+            return ("count", now - timedelta(days=1))
+        if item.type == "timeseries":
+            return ("timeseries", now - timedelta(days=item.days), item.interval)
+        if item.type == "active_users":
+            return ("active_users", now - AnalyticsService.ACTIVE_USER_RANGES[item.range])
+        if item.by is None:
+            raise ValueError(f"Query {item.id}: grouped requires 'by'")
+        return ("grouped", item.by)
+
+    @staticmethod
+    def _batch_facet(key: tuple, now: datetime) -> list[dict]:
+        if key[0] == "count":
+            return [{"$match": {"t": {"$gte": key[1], "$lte": now}}}, {"$count": "count"}]
+        if key[0] == "timeseries":
+            return AnalyticsService._timeseries_pipeline(key[2], key[1], now)
+        return AnalyticsService._active_users_pipeline(key[1])
+
+    @staticmethod
+    async def _run_batch_key(key: tuple, limit: int | None, now: datetime, db):
+        if key[0] == "count":
+            return await AnalyticsService.count_events({"created_at": {"$gte": key[1]}}, db)
+        if key[0] == "timeseries":
+            return await AnalyticsService.events_timeseries(key[2], key[1], now, db)
+        if key[0] == "active_users":
+            return await AnalyticsService.active_users(key[1], db)
+        return await AnalyticsService.events_grouped_by(key[1], db, limit)
+
+    @staticmethod
+    async def _run_facets(keys: list[tuple], now: datetime, db) -> dict:
+        """
+        Run range queries that touch the same partitions as one $facet
+        aggregation per partition, so each partition's time range is read
+        once for all of them. Returns merged results by key.
+        """
+        touching: dict[str, list[int]] = {}
+        collections = {}
+        for i, key in enumerate(keys):
+            for c in await event_partitions.collections_for_range(db, key[1], now):
+                touching.setdefault(c.name, []).append(i)
+                collections[c.name] = c
+
+        async def run(name: str) -> tuple[list[int], dict]:
+            members = touching[name]
+            start = min(keys[i][1] for i in members)
+            pipeline = [
+                {"$match": {"t": {"$gte": start, "$lte": now}}},
+                {"$facet": {f"q{i}": AnalyticsService._batch_facet(keys[i], now) for i in members}},
+            ]
+            result = await collections[name].aggregate(pipeline, **query_options()).to_list(length=1)
+            return members, result[0]
+
+        timeseries_keys = [key for key in keys if key[0] == "timeseries"]
+        partials, archived = await asyncio.gather(
+            asyncio.gather(*(run(name) for name in touching)),
+            # Days already moved to the cold archive, as in events_timeseries.
+            asyncio.gather(*(
+                event_archive.timeseries(db, key[2], key[1], now) for key in timeseries_keys
+            )),
+        )
+        merged = {key: 0 for key in keys}
+        merged.update(zip(timeseries_keys, archived))
+        for members, facets in partials:
+            for i in members:
+                key, rows = keys[i], facets[f"q{i}"]
+                if key[0] == "timeseries":
+                    for r in rows:
+                        merged[key][r["_id"]] += r["count"]
+                elif rows:
+                    merged[key] += rows[0]["count" if key[0] == "count" else "active_users"]
+        for key in keys:
+            if key[0] == "timeseries":
+                counts = merged[key]
+                merged[key] = [{"_id": bucket, "count": counts[bucket]} for bucket in sorted(counts)]
+        return merged
+
+    @staticmethod
+    async def batch_query(items, db) -> dict:
+        """
+        Answer several dashboard queries in one call. Identical queries run
+        once and share one clock. Range queries the hot window cannot serve
+        are combined into per-partition $facet aggregations; the rest run
+        concurrently through the regular query methods.
+        """
+        now = datetime.now(timezone.utc)
+        keys = {item.id: AnalyticsService._batch_key(item, now) for item in items}
+        limits: dict[tuple, int | None] = {}
+        for item in items:
+            key = keys[item.id]
+            if key[0] == "grouped":
+                # One run with the widest limit serves every item of that field.
+                previous = limits.get(key, item.limit)
+                limits[key] = None if previous is None or item.limit is None else max(previous, item.limit)
+
+        unique = list(dict.fromkeys(keys.values()))
+        facet_keys = []
+        for key in unique:
+            if key[0] == "grouped" or hot_window.covers(key[1]):
+                continue
+            if key[0] == "active_users":
+                # Distinct users cannot be summed across partitions.
+                partitions = await event_partitions.collections_for_range(db, key[1], now)
+                if len(partitions) > 1:
+                    continue
+            facet_keys.append(key)
+        if len(facet_keys) < 2:
+            facet_keys = []
+        direct_keys = [key for key in unique if key not in facet_keys]
+
+        outcomes = await asyncio.gather(
+            AnalyticsService._run_facets(facet_keys, now, db),
+            *(AnalyticsService._run_batch_key(key, limits.get(key), now, db) for key in direct_keys),
+            return_exceptions=True
+        )
+        results: dict = {}
+        facet_outcome, direct_outcomes = outcomes[0], outcomes[1:]
+        for key in facet_keys:
+            results[key] = facet_outcome if isinstance(facet_outcome, Exception) else facet_outcome[key]
+        results.update(zip(direct_keys, direct_outcomes))
+
+        response = {}
+        for item in items:
+            value = results[keys[item.id]]
+            if isinstance(value, Exception):
+                log.error("Batch query failed", extra={"query_id": item.id, "error": str(value)})
+                response[item.id] = {"error": str(value)}
+            elif item.type == "count":
+                response[item.id] = {"count": value}
+            elif item.type == "daily":
+                response[item.id] = {"daily_events": value}
+            elif item.type == "active_users":
+                response[item.id] = {"range": item.range, "active_users": value}
+            elif item.type == "grouped":
+                response[item.id] = value[:item.limit] if item.limit else value
+            else:
+                response[item.id] = value
+        return {"results": response}
+
     @staticmethod
     async def create_metric(metric, db):
         data = metric.model_dump()
@@ -200,3 +784,32 @@ class AnalyticsService:
         }
         result = await db.metric.insert_one(metric_doc)
         return {"metric_id": str(result.inserted_id), "value": value, "source": source}
+
+
+event_partitions = EventPartitions(
+    AnalyticsService.EVENT_INDEXES,
+    AnalyticsService.REDUNDANT_EVENT_INDEXES
+)
+
+settings = get_settings()
+aggregation_limiter = AggregationLimiter(settings.QUERY_MAX_CONCURRENT, settings.QUERY_MAX_QUEUED)
+ingest_rate_limiter = RateLimiter(
+    "ingest",
+    settings.RATE_LIMIT_INGEST_PER_SECOND,
+    settings.RATE_LIMIT_INGEST_BURST,
+    lease=100
+)
+query_rate_limiter = RateLimiter(
+    "query",
+    settings.RATE_LIMIT_QUERY_PER_SECOND,
+    settings.RATE_LIMIT_QUERY_BURST,
+    lease=2
+)
+event_archive = EventArchive(settings.ARCHIVE_DIR, event_partitions)
+hot_window = HotWindow(settings.HOT_WINDOW_DAYS, settings.HOT_WINDOW_ENABLED)
+session_aggregator = SessionAggregator(settings.SESSION_IDLE_TIMEOUT_SECONDS)
+topk_sketches = TopKSketches(settings.TOPK_CAPACITY)
+ingest_watermark = IngestWatermark(event_partitions, settings.WATERMARK_REFRESH_SECONDS)
+live_counters = LiveCounters(settings.LIVE_MAX_SUBSCRIBERS)
+sample_coverage = SampleCoverage()
+metadata_indexes = MetadataIndexes(event_partitions, settings.METADATA_INDEX_THRESHOLD)
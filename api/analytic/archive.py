@@ -0,0 +1,350 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from backend.api.analytic.partitions import next_month, partition_start
+
+# pyarrow is optional (archival stays disabled without it) and slow to
+# import, so it is only loaded once the archive is actually used.
+pa = pc = ds = pq = None
+SCHEMA = None
+
+log = logging.getLogger("analytic_server.archive")
+
+BUCKET_FORMAT = {"day": "%Y-%m-%d", "hour": "%Y-%m-%d %H"}
+# Storage keys whose per-day counts are kept in the manifest (GROUPABLE_FIELDS).
+GROUP_KEYS = ("n", "c", "src")
+ROW_GROUP_SIZE = 100_000
+
+
+def _load_arrow() -> None:
+    global pa, pc, ds, pq, SCHEMA
+    if SCHEMA is not None:
+        return
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    # Same compact keys as the event partitions; metadata is kept as JSON text.
+    SCHEMA = pa.schema([
+        ("_id", pa.string()),
+        ("t", pa.timestamp("ms", tz="UTC")),
+        ("n", pa.int32()),
+        ("c", pa.int32()),
+        ("src", pa.int8()),
+        ("u", pa.string()),
+        ("s", pa.string()),
+        ("m", pa.string()),
+    ])
+
+
+class LeaseLost(Exception):
+    """Another process took over a partition this one was archiving."""
+
+
+def _utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+class EventArchive:
+    """
+    Cold tier for old events: whole monthly partitions older than the
+    archive age are written to zstd-compressed Parquet files, one per UTC
+    day (``<dir>/day=YYYY-MM-DD/events.parquet``), and then dropped from
+    MongoDB. Each archived day has an ``archive_manifest`` document with
+    its row count and per-field group counts. Entries carry ``pending``
+    (the partition name) until the partition is dropped, so reads never
+    see a day both in MongoDB and in the archive.
+
+    Every worker runs maintenance, so a partition is only archived by the
+    process holding its ``archive_lease`` document. The lease is renewed
+    while the partition is written and expires if the process dies.
+
+    Reads over ranges that reach past the partitions call ``timeseries``,
+    ``group_counts`` and ``find``; only the days overlapping the range are
+    opened, with the time filter pushed down to row groups and only the
+    needed columns read.
+    """
+
+    MANIFEST_TTL_SECONDS = 60
+    LEASE_SECONDS = 300
+
+    def __init__(self, directory: str, partitions):
+        self.directory = directory
+        self.partitions = partitions
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.enabled = bool(directory) and importlib.util.find_spec("pyarrow") is not None
+        self._days: dict[str, dict] = {}
+        self._loaded_at = 0.0
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"day={day}", "events.parquet")
+
+    async def manifest(self, db) -> dict[str, dict]:
+        if self.enabled and time.monotonic() - self._loaded_at > self.MANIFEST_TTL_SECONDS:
+            self._days = {
+                entry["_id"]: entry
+                async for entry in db.archive_manifest.find({"pending": {"$exists": False}})
+            }
+            self._loaded_at = time.monotonic()
+        return self._days
+
+    async def days_for_range(self, db, start: datetime | None, end: datetime | None) -> list[str]:
+        """Archived days overlapping ``[start, end]``, newest first."""
+        first = _utc(start).date().isoformat() if start else ""
+        last = _utc(end).date().isoformat() if end else "9999-12-31"
+        return sorted((day for day in await self.manifest(db) if first <= day <= last), reverse=True)
+
+    async def _claim(self, db, name: str) -> bool:
+        """Take or renew the lease on partition ``name``."""
+        now = datetime.now(timezone.utc)
+        try:
+            await db.archive_lease.update_one(
+                {"_id": name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.LEASE_SECONDS)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Held by another process: the filter missed and the upsert collided.
+            return False
+        return True
+
+    async def _renew(self, db, name: str) -> None:
+        if not await self._claim(db, name):
+            raise LeaseLost(name)
+
+    async def archive_expired(self, db, after_days: int) -> list[str]:
+        """
+        Archive and drop every partition whose whole month is older than
+        ``after_days``. Safe to re-run after a failure: files are replaced
+        atomically and a partition is only dropped once all its days are in.
+        Partitions leased by another process are left to it.
+        """
+        if not self.enabled or after_days <= 0:
+            return []
+        _load_arrow()
+        await self._publish_dropped(db)
+        cutoff = datetime.now(timezone.utc) - timedelta(days=after_days)
+        archived = []
+        for name in sorted(await self.partitions.known(db)):
+            first = partition_start(name)
+            end = next_month(first)
+            if end > cutoff or not await self._claim(db, name):
+                continue
+            try:
+                # Another process may have finished it before this one got the lease.
+                if name not in await db.list_collection_names(filter={"name": name}):
+                    continue
+                rows = 0
+                day = first
+                while day < end:
+                    rows += await self._archive_day(db, db[name], day, name)
+                    day += timedelta(days=1)
+                await self._renew(db, name)
+                await self.partitions.drop(db, name)
+                await self._publish(db, name)
+            except LeaseLost:
+                log.warning("Lost the archive lease, leaving the partition", extra={"partition": name})
+                continue
+            finally:
+                await db.archive_lease.delete_one({"_id": name, "owner": self.owner})
+            archived.append(name)
+            log.info("Archived event partition", extra={"partition": name, "rows": rows})
+        self._loaded_at = 0.0
+        return archived
+
+    async def apply_retention(self, db, retention_days: int) -> list[str]:
+        """
+        Delete archived days older than ``retention_days``. Manifest entries
+        go first; a day's directory is only removed by a later run, once no
+        process can still list the day from a cached manifest.
+        """
+        if not self.enabled or retention_days <= 0:
+            return []
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).date().isoformat()
+        listed = {
+            entry["_id"] async for entry in db.archive_manifest.find({"_id": {"$lt": cutoff}}, {"_id": 1})
+        }
+
+        def unlisted_directories() -> list[str]:
+            if not os.path.isdir(self.directory):
+                return []
+            days = (name.removeprefix("day=") for name in os.listdir(self.directory) if name.startswith("day="))
+            return [day for day in days if day < cutoff and day not in listed]
+
+        removed = await asyncio.to_thread(unlisted_directories)
+        for day in removed:
+            await asyncio.to_thread(shutil.rmtree, os.path.dirname(self._path(day)), ignore_errors=True)
+        if listed:
+            await db.archive_manifest.delete_many({"_id": {"$in": list(listed)}})
+            self._loaded_at = 0.0
+            log.info("Expired archived days", extra={"days": len(listed), "cutoff": cutoff})
+        return sorted(listed)
+
+    @staticmethod
+    async def _publish(db, name: str) -> None:
+        await db.archive_manifest.update_many({"pending": name}, {"$unset": {"pending": ""}})
+
+    async def _publish_dropped(self, db) -> None:
+        """Publish the days of partitions dropped by a run that stopped right after."""
+        for name in await db.archive_manifest.distinct("pending"):
+            if name not in await db.list_collection_names(filter={"name": name}):
+                await self._publish(db, name)
+
+    async def _archive_day(self, db, collection, day: datetime, lease: str) -> int:
+        key = day.date().isoformat()
+        path = self._path(key)
+        # Unique per process, so an expired lease holder cannot clobber it.
+        tmp_path = f"{path}.{self.owner.replace(':', '-')}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cursor = (
+            collection
+            .find({"t": {"$gte": day, "$lt": day + timedelta(days=1)}})
+            .sort("t", 1)
+            .batch_size(10_000)
+        )
+        writer = None
+        rows = 0
+        groups = {field: Counter() for field in GROUP_KEYS}
+        batch = {field: [] for field in SCHEMA.names}
+
+        async def flush() -> None:
+            nonlocal writer
+            await self._renew(db, lease)
+            table = pa.Table.from_pydict(batch, schema=SCHEMA)
+            for field in GROUP_KEYS:
+                for item in pc.value_counts(table[field]).to_pylist():
+                    groups[field][str(item["values"])] += item["counts"]
+            if writer is None:
+                writer = await asyncio.to_thread(pq.ParquetWriter, tmp_path, SCHEMA, compression="zstd")
+            await asyncio.to_thread(writer.write_table, table)
+            for values in batch.values():
+                values.clear()
+
+        try:
+            async for doc in cursor:
+                batch["_id"].append(str(doc["_id"]))
+                batch["t"].append(doc["t"])
+                batch["n"].append(doc["n"])
+                batch["c"].append(doc["c"])
+                batch["src"].append(doc["src"])
+                batch["u"].append(doc.get("u"))
+                batch["s"].append(doc.get("s"))
+                batch["m"].append(json.dumps(doc["m"], default=str) if doc.get("m") else None)
+                rows += 1
+                if rows % ROW_GROUP_SIZE == 0:
+                    await flush()
+            if rows % ROW_GROUP_SIZE:
+                await flush()
+            if writer is None:
+                return 0
+            await asyncio.to_thread(writer.close)
+            await self._renew(db, lease)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+                os.remove(tmp_path)
+            raise
+        await db.archive_manifest.replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "rows": rows,
+                "groups": {field: dict(counts) for field, counts in groups.items()},
+                "archived_at": datetime.now(timezone.utc),
+                "pending": lease,
+            },
+            upsert=True
+        )
+        return rows
+
+    async def group_counts(self, db, key: str) -> Counter:
+        """All-time counts per code of a GROUP_KEYS field, from the manifest."""
+        counts = Counter()
+        for entry in (await self.manifest(db)).values():
+            for code, count in entry["groups"][key].items():
+                counts[int(code)] += count
+        return counts
+
+    def _time_filter(self, start: datetime | None, end: datetime | None):
+        expression = None
+        if start is not None:
+            expression = ds.field("t") >= pa.scalar(_utc(start), SCHEMA.field("t").type)
+        if end is not None:
+            upper = ds.field("t") <= pa.scalar(_utc(end), SCHEMA.field("t").type)
+            expression = upper if expression is None else expression & upper
+        return expression
+
+    async def timeseries(self, db, interval: str, start: datetime, end: datetime) -> Counter:
+        days = await self.days_for_range(db, start, end)
+        if not days:
+            return Counter()
+        _load_arrow()
+
+        def run() -> Counter:
+            dataset = ds.dataset([self._path(day) for day in days], schema=SCHEMA, format="parquet")
+            table = dataset.to_table(columns=["t"], filter=self._time_filter(start, end))
+            buckets = pc.strftime(table["t"], format=BUCKET_FORMAT[interval])
+            return Counter({
+                item["values"]: item["counts"] for item in pc.value_counts(buckets).to_pylist()
+            })
+
+        return await asyncio.to_thread(run)
+
+    async def find(
+        self,
+        db,
+        event_name_code: int | None,
+        user_id: str | None,
+        start: datetime | None,
+        end: datetime | None,
+        skip: int,
+        limit: int
+    ) -> list[dict]:
+        """
+        Archived events matching the list_events filters, newest first,
+        in storage form. Days that fall entirely inside ``skip`` are only
+        counted.
+        """
+        days = await self.days_for_range(db, start, end)
+        if not days or limit <= 0:
+            return []
+        _load_arrow()
+        expression = self._time_filter(start, end)
+        for field, value in (("n", event_name_code), ("u", user_id)):
+            if value is not None:
+                condition = ds.field(field) == value
+                expression = condition if expression is None else expression & condition
+
+        def run() -> list[dict]:
+            remaining_skip = skip
+            rows = []
+            for day in days:
+                dataset = ds.dataset(self._path(day), schema=SCHEMA, format="parquet")
+                if remaining_skip:
+                    matched = dataset.count_rows(filter=expression)
+                    if matched <= remaining_skip:
+                        remaining_skip -= matched
+                        continue
+                table = dataset.to_table(filter=expression).sort_by([("t", "descending")])
+                rows.extend(table.slice(remaining_skip, limit - len(rows)).to_pylist())
+                remaining_skip = 0
+                if len(rows) >= limit:
+                    break
+            return rows
+
+        rows = await asyncio.to_thread(run)
+        for row in rows:
+            row["m"] = json.loads(row["m"]) if row["m"] else {}
+        return rows
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from backend.utils.cache import LRUCache
+from backend.utils.mongodb import next_sequence
+
+log = logging.getLogger("analytic_server.cohorts")
+
+# Bitmaps are split into roaring-style containers of 2^16 users, each stored
+# as one document holding up to 2048 32-bit words (only non-zero words are
+# written). Words are updated with the atomic $bit operator, so concurrent
+# writers never overwrite each other.
+CONTAINER_BITS = 16
+WORD_BITS = 32
+CONTAINER_BYTES = (1 << CONTAINER_BITS) // 8
+
+ACTIVE = "a"
+NEW = "n"
+
+ACTIVITY_INDEXES = [
+    IndexModel([("k", ASCENDING), ("d", ASCENDING)], name="k_1_d_1"),
+]
+
+
+def day_key(moment: datetime | date) -> str:
+    if isinstance(moment, datetime) and moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%d")
+
+
+class UserIndex:
+    """
+    Maps user ids to dense integers (in order of first appearance), so
+    per-day activity fits in compact bitmaps.
+    """
+
+    def __init__(self, cache_size: int = 100_000):
+        self._cache = LRUCache(cache_size)
+        self._lock = asyncio.Lock()
+
+    async def dense_id(self, db, user_id: str) -> tuple[int, bool]:
+        """
+        Dense id of ``user_id`` and whether it was allocated by this call.
+        """
+        dense = self._cache.get(user_id)
+        if dense is not None:
+            return dense, False
+        entry = await db.user_index.find_one({"_id": user_id})
+        if entry:
+            self._cache.set(user_id, entry["i"])
+            return entry["i"], False
+        async with self._lock:
+            dense = await next_sequence(db, "user_index") - 1
+            try:
+                await db.user_index.insert_one({"_id": user_id, "i": dense})
+                created = True
+            except DuplicateKeyError:
+                dense = (await db.user_index.find_one({"_id": user_id}))["i"]
+                created = False
+        self._cache.set(user_id, dense)
+        return dense, created
+
+
+class ActivityBitmaps:
+    """
+    Per-day bitmaps of active users and of users first seen that day,
+    maintained at ingest. Bits are buffered in memory and OR-ed into
+    ``activity_bitmap`` on ``flush``.
+    """
+
+    def __init__(self, user_index: UserIndex):
+        self.user_index = user_index
+        # (kind, day, container) -> {word index: mask}
+        self._pending: dict[tuple[str, str, int], dict[int, int]] = {}
+
+    def _mark(self, kind: str, day: str, dense: int) -> None:
+        container, low = dense >> CONTAINER_BITS, dense & ((1 << CONTAINER_BITS) - 1)
+        words = self._pending.setdefault((kind, day, container), {})
+        word = low // WORD_BITS
+        words[word] = words.get(word, 0) | (1 << (low % WORD_BITS))
+
+    async def record(self, db, doc: dict) -> None:
+        """
+        Mark the user of a stored (compact) event document as active.
+        """
+        user = doc.get("u")
+        if user is None:
+            return
+        dense, created = await self.user_index.dense_id(db, user)
+        day = day_key(doc["t"])
+        self._mark(ACTIVE, day, dense)
+        if created:
+            self._mark(NEW, day, dense)
+
+    async def flush(self, db) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        operations = [
+            UpdateOne(
+                {"_id": f"{kind}:{day}:{container}"},
+                {
+                    "$setOnInsert": {"k": kind, "d": day, "c": container},
+                    "$bit": {f"w.{word}": {"or": mask} for word, mask in words.items()},
+                },
+                upsert=True
+            )
+            for (kind, day, container), words in pending.items()
+        ]
+        try:
+            await db.activity_bitmap.bulk_write(operations, ordered=False)
+        except Exception:
+            # Keep the bits for the next flush; OR-ing them again is harmless.
+            for key, words in pending.items():
+                merged = self._pending.setdefault(key, {})
+                for word, mask in words.items():
+                    merged[word] = merged.get(word, 0) | mask
+            raise
+
+    @staticmethod
+    def _assemble(docs: list[dict]) -> dict[int, int]:
+        """
+        Build one bitmap from a day's container documents: container number
+        -> its 2^16 bits as a Python int. Empty containers are left out, so
+        a sparse day stays small however large the user indexes are.
+        """
+        bitmap = {}
+        for doc in docs:
+            buffer = bytearray(CONTAINER_BYTES)
+            for word, value in doc.get("w", {}).items():
+                offset = int(word) * (WORD_BITS // 8)
+                buffer[offset:offset + 4] = int(value).to_bytes(4, "little")
+            bits = int.from_bytes(buffer, "little")
+            if bits:
+                bitmap[doc["c"]] = bitmap.get(doc["c"], 0) | bits
+        return bitmap
+
+    async def load(self, db, kind: str, days: list[str]) -> dict[str, dict[int, int]]:
+        by_day: dict[str, list[dict]] = {day: [] for day in days}
+        async for doc in db.activity_bitmap.find({"k": kind, "d": {"$in": days}}):
+            by_day[doc["d"]].append(doc)
+        return {day: self._assemble(docs) for day, docs in by_day.items()}
+
+    async def retention_matrix(self, db, interval: str, cohorts: int, periods: int) -> dict:
+        """
+        Cohort retention: users first seen in each period and how many of
+        them were active again ``k`` periods later, computed with bitmap ANDs.
+        """
+        span = 7 if interval == "week" else 1
+        today = datetime.now(timezone.utc).date()
+        if interval == "week":
+            today -= timedelta(days=today.weekday())
+        first = today - timedelta(days=span * (cohorts - 1))
+        days = [day_key(first + timedelta(days=i)) for i in range(span * cohorts)]
+        new, active = await asyncio.gather(self.load(db, NEW, days), self.load(db, ACTIVE, days))
+
+        def period(bitmaps: dict[str, dict[int, int]], index: int) -> dict[int, int]:
+            bitmap: dict[int, int] = {}
+            for day in days[index * span:(index + 1) * span]:
+                for container, bits in bitmaps[day].items():
+                    bitmap[container] = bitmap.get(container, 0) | bits
+            return bitmap
+
+        def intersection(a: dict[int, int], b: dict[int, int]) -> dict[int, int]:
+            # Only containers present in both can share users.
+            both = ((container, a[container] & b[container]) for container in a.keys() & b.keys())
+            return {container: bits for container, bits in both if bits}
+
+        def cardinality(bitmap: dict[int, int]) -> int:
+            return sum(bits.bit_count() for bits in bitmap.values())
+
+        active_periods = [period(active, i) for i in range(cohorts)]
+        rows = []
+        for c in range(cohorts):
+            cohort = period(new, c)
+            size = cardinality(cohort)
+            retained = [
+                cardinality(intersection(cohort, active_periods[c + k]))
+                for k in range(min(periods, cohorts - c))
+            ]
+            rows.append({
+                "cohort": days[c * span],
+                "users": size,
+                "retained": retained,
+                "rates": [round(count / size, 4) if size else 0.0 for count in retained],
+            })
+        return {"interval": interval, "cohorts": rows}
+
+
+user_index = UserIndex()
+activity_bitmaps = ActivityBitmaps(user_index)
@@ -0,0 +1,67 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from backend.utils.bloom import RotatingBloomFilter
+from backend.utils.settings import get_settings
+
+log = logging.getLogger("analytic_server.dedup")
+settings = get_settings()
+
+
+class EventDeduplicator:
+    """
+    Rejects retried events carrying an idempotency key that was already seen.
+
+    Keys are checked against an in-memory Bloom filter first: a miss means
+    the key is new and the event is accepted without touching MongoDB. Only
+    on a hit is the key looked up (on the partial unique ``k`` index) to tell
+    a real duplicate from a false positive. The unique index remains the
+    backstop for retries handled by another process or still in flight.
+    It is per monthly partition, though: a retry stored in a later month
+    than the original is only caught by the lookup above, so only by the
+    process that saw the original.
+    """
+
+    def __init__(self, window_seconds: int, capacity: int, error_rate: float):
+        self.window_seconds = window_seconds
+        self.filter = RotatingBloomFilter(window_seconds, capacity, error_rate)
+        self.checked = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.false_positives = 0
+        self.index_duplicates = 0
+
+    async def is_duplicate(self, key: str, partitions, db) -> bool:
+        self.checked += 1
+        if self.filter.might_contain(key):
+            now = datetime.now(timezone.utc)
+            start = now - timedelta(seconds=self.window_seconds)
+            for collection in await partitions.collections_for_range(db, start, now):
+                if await collection.find_one({"k": key}, {"_id": 1}):
+                    self.duplicates += 1
+                    return True
+            self.false_positives += 1
+        self.filter.add(key)
+        self.accepted += 1
+        return False
+
+    def record_index_duplicate(self) -> None:
+        self.index_duplicates += 1
+
+    def stats(self) -> dict:
+        rejected = self.duplicates + self.index_duplicates
+        return {
+            "checked": self.checked,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "index_duplicates": self.index_duplicates,
+            "false_positives": self.false_positives,
+            "dedup_rate": round(rejected / self.checked, 6) if self.checked else 0.0,
+            "window_seconds": self.window_seconds,
+        }
+
+
+event_deduplicator = EventDeduplicator(
+    settings.DEDUP_WINDOW_SECONDS,
+    settings.DEDUP_CAPACITY,
+    settings.DEDUP_ERROR_RATE
+)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+from backend.api.analytic.sampling import sample_key
+from backend.api.analytic.schemas.request import Source
+from backend.utils.mongodb import next_sequence
+
+log = logging.getLogger("analytic_server.encoding")
+
+# API field -> storage key of an event document.
+FIELD_KEYS = {
+    "event_name": "n",
+    "event_category": "c",
+    "user_id": "u",
+    "session_id": "s",
+    "source": "src",
+    "metadata": "m",
+    "created_at": "t",
+    "idempotency_key": "k",
+}
+STORAGE_FIELDS = {key: field for field, key in FIELD_KEYS.items()}
+
+# Low-cardinality strings stored as small integers. Sources are a closed
+# enum so their codes are fixed here; event names and categories are
+# interned on first use through the ``event_dictionary`` collection.
+SOURCE_CODES = {
+    Source.web.value: 0,
+    Source.mobile.value: 1,
+    Source.backend.value: 2,
+    Source.ios.value: 3,
+    Source.android.value: 4,
+}
+SOURCE_VALUES = {code: value for value, code in SOURCE_CODES.items()}
+DICTIONARY_FIELDS = ("event_name", "event_category")
+
+DICTIONARY_INDEXES = [
+    IndexModel([("f", ASCENDING), ("v", ASCENDING)], name="f_1_v_1", unique=True),
+    IndexModel([("f", ASCENDING), ("code", ASCENDING)], name="f_1_code_1", unique=True),
+]
+
+
+class EventCodec:
+    """
+    Maps events between the API shape and the compact storage shape:
+    short keys, dictionary-encoded names/categories/sources, and no
+    empty optional fields.
+    """
+
+    def __init__(self) -> None:
+        self._codes: dict[str, dict[str, int]] = {field: {} for field in DICTIONARY_FIELDS}
+        self._values: dict[str, dict[int, str]] = {field: {} for field in DICTIONARY_FIELDS}
+        self._lock = asyncio.Lock()
+
+    def _remember(self, field: str, value: str, code: int) -> None:
+        self._codes[field][value] = code
+        self._values[field][code] = value
+
+    async def load(self, db) -> None:
+        """
+        Warm the in-process lookup table with the whole dictionary.
+        """
+        async for entry in db.event_dictionary.find({}, {"_id": 0}):
+            self._remember(entry["f"], entry["v"], entry["code"])
+
+    async def lookup(self, db, field: str, value: str) -> int | None:
+        """
+        Code of an existing value, None if the value was never stored.
+        """
+        if field == "source":
+            return SOURCE_CODES.get(value)
+        code = self._codes[field].get(value)
+        if code is None:
+            entry = await db.event_dictionary.find_one({"f": field, "v": value})
+            if entry:
+                code = entry["code"]
+                self._remember(field, value, code)
+        return code
+
+    async def intern(self, db, field: str, value: str) -> int:
+        """
+        Code of ``value``, allocating a new one if it has never been seen.
+        """
+        code = await self.lookup(db, field, value)
+        if code is not None:
+            return code
+        async with self._lock:
+            code = self._codes[field].get(value)
+            if code is not None:
+                return code
+            code = await next_sequence(db, f"event_dictionary.{field}")
+            try:
+                await db.event_dictionary.insert_one({"f": field, "v": value, "code": code})
+            except DuplicateKeyError:
+                # Another process interned it first.
+                entry = await db.event_dictionary.find_one({"f": field, "v": value})
+                code = entry["code"]
+            self._remember(field, value, code)
+            return code
+
+    async def value(self, db, field: str, code: int | None) -> str | None:
+        if code is None:
+            return None
+        if field == "source":
+            return SOURCE_VALUES.get(code)
+        value = self._values[field].get(code)
+        if value is None:
+            entry = await db.event_dictionary.find_one({"f": field, "code": code})
+            if entry:
+                value = entry["v"]
+                self._remember(field, value, code)
+        return value
+
+    async def encode(self, db, data: dict) -> dict:
+        source = data["source"]
+        doc = {
+            "n": await self.intern(db, "event_name", data["event_name"]),
+            "c": await self.intern(db, "event_category", data["event_category"]),
+            "src": SOURCE_CODES[getattr(source, "value", source)],
+            "t": data["created_at"],
+        }
+        if data.get("user_id") is not None:
+            doc["u"] = data["user_id"]
+        if data.get("session_id") is not None:
+            doc["s"] = data["session_id"]
+        if data.get("metadata"):
+            doc["m"] = data["metadata"]
+        if data.get("idempotency_key"):
+            doc["k"] = data["idempotency_key"]
+        # The id is assigned here so the sample key can be derived from it.
+        doc["_id"] = data["_id"] if "_id" in data else ObjectId()
+        doc["h"] = sample_key(doc["_id"])
+        return doc
+
+    async def decode(self, db, doc: dict) -> dict:
+        event = {
+            "event_name": await self.value(db, "event_name", doc.get("n")),
+            "event_category": await self.value(db, "event_category", doc.get("c")),
+            "user_id": doc.get("u"),
+            "session_id": doc.get("s"),
+            "source": await self.value(db, "source", doc.get("src")),
+            "metadata": doc.get("m", {}),
+            "created_at": doc.get("t"),
+        }
+        if "_id" in doc:
+            event["_id"] = str(doc["_id"])
+        return event
+
+    @staticmethod
+    def storage_filter(filters: dict) -> dict:
+        """
+        Rename the top-level API fields of a filter to storage keys.
+        Values are left untouched, so only use it for non-encoded fields.
+        """
+        return {FIELD_KEYS.get(field, field): value for field, value in filters.items()}
+
+
+event_codec = EventCodec()
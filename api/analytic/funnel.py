@@ -0,0 +1,125 @@
+import heapq
+import random
+import statistics
+
+
+class _Descending:
+    """
+    Inverts ordering so heapq can merge streams sorted in descending order.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return self.value > other.value
+
+    def __eq__(self, other: "_Descending") -> bool:
+        return self.value == other.value
+
+
+async def merge_user_streams(cursors):
+    """
+    K-way merge of cursors sorted by (u DESC, t ASC) into one stream with the
+    same order, holding a single document per cursor in memory.
+    """
+    heap = []
+    for index, cursor in enumerate(cursors):
+        doc = await anext(cursor, None)
+        if doc is not None:
+            heap.append((_Descending(doc["u"]), doc["t"], index, doc))
+    heapq.heapify(heap)
+    while heap:
+        _, _, index, doc = heap[0]
+        yield doc
+        following = await anext(cursors[index], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (_Descending(following["u"]), following["t"], index, following))
+
+
+class FunnelMatcher:
+    """
+    Ordered funnel evaluation over events grouped by user and sorted by time.
+
+    Only the state of the current user is kept: for every step, the start
+    time of the latest chain that reached it (a later start leaves more of
+    the conversion window for the next steps). Time-to-convert samples are
+    kept in fixed-size reservoirs, so memory does not grow with the number
+    of users.
+    """
+
+    RESERVOIR_SIZE = 10_000
+
+    def __init__(self, step_codes: list[int], window_seconds: int):
+        self.step_codes = step_codes
+        self.window = window_seconds
+        self.users = [0] * len(step_codes)
+        self._samples = [[] for _ in step_codes]
+        self._seen = [0] * len(step_codes)
+        self._random = random.Random(0)
+        self._user = None
+        self._starts: list[float | None] = []
+        self._reached = -1
+
+    def _finish_user(self) -> None:
+        for step in range(self._reached + 1):
+            self.users[step] += 1
+
+    def _sample(self, step: int, seconds: float) -> None:
+        self._seen[step] += 1
+        samples = self._samples[step]
+        if len(samples) < self.RESERVOIR_SIZE:
+            samples.append(seconds)
+        else:
+            slot = self._random.randrange(self._seen[step])
+            if slot < self.RESERVOIR_SIZE:
+                samples[slot] = seconds
+
+    def feed(self, user: str, at: float, code: int) -> None:
+        if user != self._user:
+            if self._user is not None:
+                self._finish_user()
+            self._user = user
+            self._starts = [None] * len(self.step_codes)
+            self._reached = -1
+        # Walk steps backwards so one event never advances two steps.
+        for step in range(len(self.step_codes) - 1, -1, -1):
+            if self.step_codes[step] != code:
+                continue
+            if step == 0:
+                self._starts[0] = at
+                self._reached = max(self._reached, 0)
+                continue
+            start = self._starts[step - 1]
+            if start is None or at - start > self.window:
+                continue
+            if self._reached < step:
+                self._reached = step
+                self._sample(step, at - start)
+            if self._starts[step] is None or start > self._starts[step]:
+                self._starts[step] = start
+
+    def result(self, step_names: list[str]) -> dict:
+        if self._user is not None:
+            self._finish_user()
+            self._user = None
+        entered = self.users[0]
+        return {
+            "users_entered": entered,
+            "window_seconds": self.window,
+            "steps": [
+                {
+                    "event_name": name,
+                    "users": self.users[step],
+                    "conversion_rate": round(self.users[step] / entered, 4) if entered else 0.0,
+                    "median_seconds_to_convert": (
+                        round(statistics.median(self._samples[step]), 3)
+                        if self._samples[step] else None
+                    ),
+                }
+                for step, name in enumerate(step_names)
+            ],
+        }
@@ -0,0 +1,224 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+
+# numpy is optional (the hot window stays disabled without it) and only
+# imported when the hot window is enabled.
+np = None
+
+log = logging.getLogger("analytic_server.hot_window")
+
+BUCKET_MS = {"day": 86_400_000, "hour": 3_600_000}
+BUCKET_FORMAT = {"day": "%Y-%m-%d", "hour": "%Y-%m-%d %H"}
+ANONYMOUS = -1
+
+
+def _load_numpy() -> bool:
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return False
+    return True
+
+
+def _epoch_ms(moment: datetime) -> int:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+class HotWindow:
+    """
+    Columnar in-process copy of the most recent events (timestamps, interned
+    name/category/source codes and user ids as NumPy arrays) that answers
+    counts, group-bys and time bucketing without a MongoDB round trip.
+
+    New rows are appended to Python lists and compacted into time-sorted
+    arrays on the next query, which also evicts rows older than the window.
+    Callers must check ``covers(start)`` and fall back to MongoDB otherwise.
+    """
+
+    # Events inserted by other processes are picked up by ``sync``, which
+    # re-reads this much history to tolerate ObjectId clock skew.
+    SYNC_OVERLAP = timedelta(seconds=30)
+    # Rows are kept a little longer than the window, so a query for exactly
+    # the window length (e.g. the last 7 days) is still answered here.
+    RETENTION_SLACK = timedelta(hours=1)
+    # Interned user ids are renumbered once the table holds twice as many
+    # users as the rows still reference (and at least this many).
+    USERS_COMPACT_MIN = 10_000
+
+    def __init__(self, window_days: int, enabled: bool):
+        self.window = timedelta(days=window_days)
+        self.retention = self.window + self.RETENTION_SLACK
+        self.enabled = enabled and _load_numpy()
+        if enabled and np is None:
+            log.warning("numpy is not installed, hot window disabled")
+        self.ready = False
+        self._loaded_from: datetime | None = None
+        self._synced_at: datetime | None = None
+        self._users: dict[str, int] = {}
+        self._live_users = 0
+        self._seen_ids: set[ObjectId] = set()
+        self._buffer: list[tuple[int, int, int, int, int]] = []
+        if self.enabled:
+            self._t = np.empty(0, dtype=np.int64)
+            self._n = np.empty(0, dtype=np.int32)
+            self._c = np.empty(0, dtype=np.int32)
+            self._src = np.empty(0, dtype=np.int8)
+            self._u = np.empty(0, dtype=np.int32)
+
+    # -------------------------
+    # Ingestion
+    # -------------------------
+    def append(self, doc: dict) -> None:
+        """
+        Add one stored (compact) event document.
+        """
+        if not self.enabled:
+            return
+        oid = doc.get("_id")
+        if oid is not None:
+            if oid in self._seen_ids:
+                return
+            if self._synced_at is None or oid.generation_time >= self._synced_at - self.SYNC_OVERLAP:
+                self._seen_ids.add(oid)
+        user = doc.get("u")
+        user_code = ANONYMOUS if user is None else self._users.setdefault(user, len(self._users))
+        self._buffer.append((_epoch_ms(doc["t"]), doc["n"], doc["c"], doc["src"], user_code))
+
+    async def backfill(self, partitions, db) -> None:
+        """
+        Load the window from MongoDB. Queries fall back to MongoDB until done.
+        """
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        start = now - self.retention
+        self._synced_at = now
+        projection = {"t": 1, "n": 1, "c": 1, "src": 1, "u": 1}
+        for collection in await partitions.collections_for_range(db, start, now):
+            cursor = collection.find({"t": {"$gte": start}}, projection, batch_size=10_000)
+            async for doc in cursor:
+                self.append(doc)
+        self._loaded_from = start
+        self._compact()
+        self.ready = True
+        log.info("Hot window loaded", extra={
+            "rows": len(self._t),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+
+    async def sync(self, partitions, db) -> None:
+        """
+        Append events inserted by other processes since the last sync.
+        """
+        if not self.ready:
+            return
+        now = datetime.now(timezone.utc)
+        floor = self._synced_at - self.SYNC_OVERLAP
+        query = {"_id": {"$gte": ObjectId.from_datetime(floor)}}
+        projection = {"t": 1, "n": 1, "c": 1, "src": 1, "u": 1}
+        for collection in await partitions.collections_for_range(db, floor, now):
+            async for doc in collection.find(query, projection):
+                self.append(doc)
+        self._synced_at = now
+        self._seen_ids = {oid for oid in self._seen_ids if oid.generation_time >= now - self.SYNC_OVERLAP}
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def covers(self, start: datetime) -> bool:
+        if not self.ready:
+            return False
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        return start >= max(self._loaded_from, datetime.now(timezone.utc) - self.retention)
+
+    def _compact(self) -> None:
+        if self._buffer:
+            t, n, c, src, u = (np.array(column) for column in zip(*self._buffer))
+            self._buffer = []
+            self._t = np.concatenate([self._t, t.astype(np.int64)])
+            self._n = np.concatenate([self._n, n.astype(np.int32)])
+            self._c = np.concatenate([self._c, c.astype(np.int32)])
+            self._src = np.concatenate([self._src, src.astype(np.int8)])
+            self._u = np.concatenate([self._u, u.astype(np.int32)])
+            # Rows arrive almost sorted, which a stable sort handles cheaply.
+            order = np.argsort(self._t, kind="stable")
+            self._t, self._n, self._c, self._src, self._u = (
+                self._t[order], self._n[order], self._c[order], self._src[order], self._u[order]
+            )
+        # Evict a few minutes later than ``covers`` stops accepting a start,
+        # so a range accepted by ``covers`` never loses rows to eviction.
+        cutoff = _epoch_ms(datetime.now(timezone.utc) - self.retention - timedelta(minutes=5))
+        expired = int(np.searchsorted(self._t, cutoff, side="left"))
+        if expired:
+            self._t, self._n, self._c, self._src, self._u = (
+                self._t[expired:].copy(), self._n[expired:].copy(), self._c[expired:].copy(),
+                self._src[expired:].copy(), self._u[expired:].copy()
+            )
+            if len(self._users) >= max(2 * self._live_users, self.USERS_COMPACT_MIN):
+                self._compact_users()
+
+    def _compact_users(self) -> None:
+        """
+        Forget users whose rows were all evicted and renumber the others,
+        so the intern table tracks the window instead of every user seen.
+        """
+        # Codes were handed out in insertion order, so they index this list.
+        names = list(self._users)
+        live = np.unique(self._u[self._u != ANONYMOUS])
+        remap = np.arange(len(names), dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        self._u = np.where(self._u == ANONYMOUS, ANONYMOUS, remap[self._u]).astype(np.int32)
+        self._users = {names[code]: i for i, code in enumerate(live.tolist())}
+        self._live_users = len(self._users)
+
+    def _slice(self, start: datetime, end: datetime | None) -> slice:
+        self._compact()
+        lo = int(np.searchsorted(self._t, _epoch_ms(start), side="left"))
+        hi = len(self._t) if end is None else int(np.searchsorted(self._t, _epoch_ms(end), side="right"))
+        return slice(lo, hi)
+
+    def count(self, start: datetime, end: datetime | None = None) -> int:
+        rows = self._slice(start, end)
+        return rows.stop - rows.start
+
+    def group_counts(self, field: str, start: datetime, end: datetime | None = None) -> dict[int, int]:
+        # _slice compacts first, which replaces the column arrays.
+        rows = self._slice(start, end)
+        column = {"event_name": self._n, "event_category": self._c, "source": self._src}[field]
+        codes, counts = np.unique(column[rows], return_counts=True)
+        return {int(code): int(count) for code, count in zip(codes, counts)}
+
+    def timeseries(self, interval: str, start: datetime, end: datetime) -> list[dict]:
+        size = BUCKET_MS[interval]
+        rows = self._slice(start, end)
+        buckets, counts = np.unique(self._t[rows] // size, return_counts=True)
+        return [
+            {
+                "_id": datetime.fromtimestamp(int(bucket) * size / 1000, tz=timezone.utc)
+                .strftime(BUCKET_FORMAT[interval]),
+                "count": int(count)
+            }
+            for bucket, count in zip(buckets, counts)
+        ]
+
+    def active_users(self, start: datetime) -> int:
+        # Anonymous events count as one user, like the $group on null in MongoDB.
+        rows = self._slice(start, None)
+        return int(len(np.unique(self._u[rows])))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "rows": (len(self._t) + len(self._buffer)) if self.enabled else 0,
+            "users": len(self._users),
+            "window_days": self.window.days,
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+log = logging.getLogger("analytic_server.live")
+
+# One ``live_counter`` document per second ("s:<epoch>") and per minute
+# ("m:<epoch>") holding the counts of all processes; expired by TTL.
+LIVE_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0),
+]
+LIVE_RETENTION = timedelta(hours=2)
+
+
+def _escape(name: str) -> str:
+    # Field names in update paths cannot contain "." or start with "$".
+    return name.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _window(docs: dict, prefix: str, current: int, size: int) -> tuple[list[int], Counter]:
+    totals, names = [], Counter()
+    for epoch in range(current - size + 1, current + 1):
+        doc = docs.get(f"{prefix}:{epoch}")
+        totals.append(doc["total"] if doc else 0)
+        if doc:
+            names.update({unquote(name): count for name, count in doc.get("n", {}).items()})
+    return totals, names
+
+
+class _Ring:
+    """
+    Fixed ring of ``size`` buckets of ``width`` seconds, each holding a
+    total and per-event-name counts. Buckets are reset lazily when reused.
+    """
+
+    def __init__(self, size: int, width: int):
+        self.size = size
+        self.width = width
+        self._epochs = [-1] * size
+        self._totals = [0] * size
+        self._names = [Counter() for _ in range(size)]
+
+    def _slot(self, epoch: int) -> int:
+        slot = epoch % self.size
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._totals[slot] = 0
+            self._names[slot].clear()
+        return slot
+
+    def add(self, name: str, now: float) -> None:
+        slot = self._slot(int(now) // self.width)
+        self._totals[slot] += 1
+        self._names[slot][name] += 1
+
+    def totals(self, now: float) -> list[int]:
+        """Bucket totals for the last ``size`` buckets, oldest first."""
+        current = int(now) // self.width
+        return [
+            self._totals[epoch % self.size] if self._epochs[epoch % self.size] == epoch else 0
+            for epoch in range(current - self.size + 1, current + 1)
+        ]
+
+    def names(self, now: float) -> Counter:
+        current = int(now) // self.width
+        merged = Counter()
+        for slot, epoch in enumerate(self._epochs):
+            if current - self.size < epoch <= current:
+                merged.update(self._names[slot])
+        return merged
+
+
+class Subscriber:
+    """
+    Holds only the latest unread message, so a slow client skips
+    intermediate updates instead of building up a backlog.
+    """
+
+    def __init__(self):
+        self._latest: str | None = None
+        self._ready = asyncio.Event()
+        self.coalesced = 0
+
+    def push(self, message: str) -> None:
+        if self._ready.is_set():
+            self.coalesced += 1
+        self._latest = message
+        self._ready.set()
+
+    async def next(self, timeout: float) -> str | None:
+        """Latest message, or None if nothing arrived within ``timeout``."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        return self._latest
+
+
+class LiveCounters:
+    """
+    Per-second and per-minute event counters (overall and per event name)
+    fed by the ingestion path. ``publish`` builds one snapshot and fans it
+    out to every subscriber, so the cost of a push does not grow with the
+    number of connected dashboards.
+
+    Every worker ingests part of the traffic, so on each push the counts
+    recorded since the last one are added to shared ``live_counter``
+    documents with $inc, and processes with subscribers read back the
+    totals of all workers. The in-memory rings only serve when the shared
+    view is unavailable.
+    """
+
+    # How long the last read of the shared counters is used for snapshots.
+    SHARED_TTL_SECONDS = 10
+
+    def __init__(self, max_subscribers: int, top_names: int = 50):
+        self.max_subscribers = max_subscribers
+        self.top_names = top_names
+        self._seconds = _Ring(60, 1)
+        self._minutes = _Ring(60, 60)
+        self._subscribers: set[Subscriber] = set()
+        # live_counter _id -> counts per event name not yet written.
+        self._pending: dict[str, Counter] = {}
+        self._shared: dict[str, dict] = {}
+        self._shared_at = 0.0
+
+    def record(self, event_name: str, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        self._seconds.add(event_name, now)
+        self._minutes.add(event_name, now)
+        for key in (f"s:{int(now)}", f"m:{int(now) // 60}"):
+            self._pending.setdefault(key, Counter())[event_name] += 1
+
+    async def sync(self, db) -> None:
+        """
+        Write this process's new counts to the shared documents and, when
+        someone is subscribed here, read back the last hour for all workers.
+        """
+        pending, self._pending = self._pending, {}
+        if pending:
+            expires_at = datetime.now(timezone.utc) + LIVE_RETENTION
+            try:
+                await db.live_counter.bulk_write([
+                    UpdateOne(
+                        {"_id": key},
+                        {
+                            "$inc": {
+                                "total": sum(names.values()),
+                                **{f"n.{_escape(name)}": count for name, count in names.items()}
+                            },
+                            "$setOnInsert": {"expires_at": expires_at},
+                        },
+                        upsert=True
+                    )
+                    for key, names in pending.items()
+                ], ordered=False)
+            except Exception:
+                # Keep the counts for the next push.
+                for key, names in pending.items():
+                    self._pending.setdefault(key, Counter()).update(names)
+                raise
+        if not self._subscribers:
+            return
+        now = time.time()
+        second, minute = int(now), int(now) // 60
+        ids = [f"s:{epoch}" for epoch in range(second - 59, second + 1)]
+        ids += [f"m:{epoch}" for epoch in range(minute - 59, minute + 1)]
+        self._shared = {doc["_id"]: doc async for doc in db.live_counter.find({"_id": {"$in": ids}})}
+        self._shared_at = now
+
+    def snapshot(self, now: float | None = None) -> dict:
+        now = time.time() if now is None else now
+        if now - self._shared_at <= self.SHARED_TTL_SECONDS:
+            per_second, second_names = _window(self._shared, "s", int(now), 60)
+            per_minute, minute_names = _window(self._shared, "m", int(now) // 60, 60)
+        else:
+            per_second, second_names = self._seconds.totals(now), self._seconds.names(now)
+            per_minute, minute_names = self._minutes.totals(now), self._minutes.names(now)
+        return {
+            "ts": now,
+            "per_second": per_second,
+            "per_minute": per_minute,
+            "last_minute": {
+                "total": sum(per_second),
+                "by_event": dict(second_names.most_common(self.top_names)),
+            },
+            "last_hour": {
+                "total": sum(per_minute),
+                "by_event": dict(minute_names.most_common(self.top_names)),
+            },
+        }
+
+    def subscribe(self) -> Subscriber:
+        if len(self._subscribers) >= self.max_subscribers:
+            raise OverflowError("Too many live subscribers")
+        subscriber = Subscriber()
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    async def publish(self, db) -> None:
+        try:
+            await self.sync(db)
+        except Exception:
+            log.exception("Failed to sync live counters, serving local counts")
+        if not self._subscribers:
+            return
+        message = json.dumps(self.snapshot())
+        for subscriber in self._subscribers:
+            subscriber.push(message)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "coalesced": sum(s.coalesced for s in self._subscribers),
+        }
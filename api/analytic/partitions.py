@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo import IndexModel
+from pymongo.errors import BulkWriteError
+from backend.utils.mongodb import ensure_collection_indexes
+
+log = logging.getLogger("analytic_server.partitions")
+
+PARTITION_PREFIX = "event_"
+PARTITION_PATTERN = re.compile(r"^event_(\d{4})(\d{2})$")
+LEGACY_COLLECTION = "event"
+
+
+def _utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def month_start(moment: datetime) -> datetime:
+    return _utc(moment).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment: datetime) -> datetime:
+    start = month_start(moment)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(moment: datetime) -> str:
+    return f"{PARTITION_PREFIX}{_utc(moment):%Y%m}"
+
+
+def partition_start(name: str) -> datetime:
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        raise ValueError(f"Not an event partition: {name}")
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+class EventPartitions:
+    """
+    Events are stored in one collection per calendar month (``event_YYYYMM``,
+    UTC, keyed on ``created_at``). Queries only touch the partitions that
+    overlap the requested range, and retention drops whole partitions.
+    """
+
+    # How long the list of existing partitions is trusted before re-reading it.
+    KNOWN_TTL_SECONDS = 60
+
+    def __init__(self, indexes: list[IndexModel], redundant: list[str] | None = None):
+        self.indexes = indexes
+        self.redundant = redundant or []
+        self._ensured: set[str] = set()
+        self._known: set[str] = set()
+        self._known_at: float = 0.0
+        self._lock = asyncio.Lock()
+
+    async def known(self, db) -> set[str]:
+        if time.monotonic() - self._known_at > self.KNOWN_TTL_SECONDS:
+            names = await db.list_collection_names(
+                filter={"name": {"$regex": PARTITION_PATTERN.pattern}}
+            )
+            self._known = set(names) | self._ensured
+            self._known_at = time.monotonic()
+        return self._known
+
+    async def names_for_range(
+        self,
+        db,
+        start: datetime | None,
+        end: datetime | None
+    ) -> list[str]:
+        """
+        Existing partitions overlapping ``[start, end]``, newest first.
+        An open start extends to the oldest partition, an open end to now
+        (partitions for future months are pre-created empty).
+        """
+        end = end or datetime.now(timezone.utc)
+        names = []
+        for name in await self.known(db):
+            first = partition_start(name)
+            if first > _utc(end):
+                continue
+            if start is not None and next_month(first) <= _utc(start):
+                continue
+            names.append(name)
+        return sorted(names, reverse=True)
+
+    async def collections_for_range(self, db, start: datetime | None, end: datetime | None) -> list:
+        return [db[name] for name in await self.names_for_range(db, start, end)]
+
+    async def ensure(self, db, moment: datetime):
+        """
+        Partition collection for ``moment``, creating its indexes the first
+        time this process writes to it.
+        """
+        name = partition_name(moment)
+        if name not in self._ensured:
+            async with self._lock:
+                if name not in self._ensured:
+                    await ensure_collection_indexes(db[name], self.indexes, self.redundant)
+                    self._ensured.add(name)
+                    self._known.add(name)
+        return db[name]
+
+    async def prepare(self, db) -> None:
+        """
+        Pre-create the current and next month partitions, so the first insert
+        of a month does not wait for index builds.
+        """
+        now = datetime.now(timezone.utc)
+        await asyncio.gather(self.ensure(db, now), self.ensure(db, next_month(now)))
+
+    async def maintain(self, db, retention_days: int) -> None:
+        """
+        ``prepare`` and apply retention. Run it after archiving (see
+        EventArchive), or months past both ages are dropped unarchived.
+        """
+        now = datetime.now(timezone.utc)
+        await self.prepare(db)
+        if retention_days > 0:
+            await self.apply_retention(db, now - timedelta(days=retention_days))
+
+    async def apply_retention(self, db, cutoff: datetime) -> list[str]:
+        """
+        Drop every partition whose whole month lies before ``cutoff``.
+        """
+        self._known_at = 0.0
+        dropped = []
+        for name in await self.known(db):
+            if next_month(partition_start(name)) <= _utc(cutoff):
+                await self.drop(db, name)
+                dropped.append(name)
+        if dropped:
+            log.info("Dropped expired event partitions", extra={"partitions": dropped})
+        return dropped
+
+    async def drop(self, db, name: str) -> None:
+        await db.drop_collection(name)
+        self._known.discard(name)
+        self._ensured.discard(name)
+
+    async def migrate_legacy(self, db, encode, batch_size: int = 1000) -> int:
+        """
+        Copy events from the former single ``event`` collection into monthly
+        partitions, converting each document with ``encode(db, doc)``.
+        Safe to re-run: documents keep their ``_id`` and duplicates are skipped.
+        """
+        migrated = 0
+        batch: dict[str, list[dict]] = {}
+
+        async def flush() -> None:
+            for name, docs in batch.items():
+                try:
+                    await db[name].insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                        raise
+            batch.clear()
+
+        async for legacy in db[LEGACY_COLLECTION].find({}).sort("created_at", 1):
+            doc = await encode(db, legacy)
+            collection = await self.ensure(db, doc["t"])
+            batch.setdefault(collection.name, []).append(doc)
+            migrated += 1
+            if migrated % batch_size == 0:
+                await flush()
+        await flush()
+        return migrated
+
+
+if __name__ == "__main__":
+    from backend.api.analytic.analytic_service import event_partitions
+    from backend.api.analytic.encoding import event_codec
+    from backend.utils.mongodb import connect_to_mongo, close_mongo, get_db
+
+    async def _migrate() -> None:
+        await connect_to_mongo()
+        try:
+            print(await event_partitions.migrate_legacy(get_db(), event_codec.encode))
+        finally:
+            await close_mongo()
+
+    asyncio.run(_migrate())
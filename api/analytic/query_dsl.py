@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from backend.api.analytic.encoding import FIELD_KEYS
+from backend.api.analytic.partitions import next_month, partition_name
+from backend.utils.mongodb import ensure_collection_indexes
+
+log = logging.getLogger("analytic_server.query")
+
+# Top-level event fields usable in ad-hoc filters and groupings.
+QUERY_FIELDS = {"event_name", "event_category", "source", "user_id", "session_id"}
+# Fields stored as dictionary codes: codes carry no order, so only
+# (in)equality operators are allowed on them.
+ENCODED_FIELDS = {"event_name", "event_category", "source"}
+EQUALITY_OPS = {"eq", "ne", "in", "nin", "exists"}
+MONGO_OPS = {
+    "eq": "$eq", "ne": "$ne", "in": "$in", "nin": "$nin",
+    "gt": "$gt", "gte": "$gte", "lt": "$lt", "lte": "$lte", "exists": "$exists",
+}
+SCALAR_TYPES = (str, int, float, bool, type(None))
+METADATA_PREFIX = "metadata."
+
+
+def storage_key(field: str, metadata_keys: set[str]) -> str:
+    """
+    Validate an API field (top-level or ``metadata.<key>``) and return its
+    storage path. Raises ValueError for anything not whitelisted.
+    """
+    if field in QUERY_FIELDS:
+        return FIELD_KEYS[field]
+    if field.startswith(METADATA_PREFIX):
+        key = field[len(METADATA_PREFIX):]
+        if key in metadata_keys:
+            return f"m.{key}"
+        raise ValueError(f"Metadata key is not queryable: {key}")
+    raise ValueError(f"Unknown field: {field}")
+
+
+def metadata_index_name(key: str) -> str:
+    return f"m.{key}_1_t_-1"
+
+
+class MetadataIndexes:
+    """
+    Creates a (metadata.<key>, t) index once a whitelisted metadata key has
+    been filtered on ``threshold`` times. Indexed keys are recorded in
+    ``metadata_index`` and applied to every partition created afterwards.
+    """
+
+    def __init__(self, partitions, threshold: int):
+        self.partitions = partitions
+        self.threshold = threshold
+        self.indexed: set[str] = set()
+        self._usage: Counter = Counter()
+        self._building: set[str] = set()
+        # Strong references: the event loop only keeps weak ones to tasks.
+        self._tasks: set[asyncio.Task] = set()
+
+    @staticmethod
+    def index_for(key: str) -> IndexModel:
+        return IndexModel([(f"m.{key}", ASCENDING), ("t", DESCENDING)], name=metadata_index_name(key))
+
+    async def load(self, db) -> None:
+        async for entry in db.metadata_index.find({}):
+            self._register(entry["_id"])
+
+    def _register(self, key: str) -> None:
+        if key not in self.indexed:
+            self.indexed.add(key)
+            self.partitions.indexes = [*self.partitions.indexes, self.index_for(key)]
+
+    def record_usage(self, db, keys: set[str]) -> None:
+        for key in keys - self.indexed - self._building:
+            self._usage[key] += 1
+            if self._usage[key] >= self.threshold:
+                self._building.add(key)
+                task = asyncio.create_task(self._create(db, key))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _create(self, db, key: str) -> None:
+        try:
+            await db.metadata_index.update_one({"_id": key}, {"$setOnInsert": {"_id": key}}, upsert=True)
+            self._register(key)
+            # The current and next partitions get the index now, later ones
+            # through ensure(). Older partitions are left as they are.
+            now = datetime.now(timezone.utc)
+            for moment in (now, next_month(now)):
+                await ensure_collection_indexes(db[partition_name(moment)], [self.index_for(key)])
+            log.info("Created metadata index", extra={"key": key})
+        except Exception:
+            log.exception("Failed to create metadata index", extra={"key": key})
+        finally:
+            self._building.discard(key)
+
+
+async def compile_match(filters, metadata_keys: set[str], lookup, db) -> tuple[dict, set[str]]:
+    """
+    Compile validated filters into a $match document on storage keys.
+    ``lookup(db, field, value)`` resolves dictionary codes. Returns the
+    match and the metadata keys it uses.
+    """
+    match: dict = {}
+    used_metadata: set[str] = set()
+    for clause in filters:
+        key = storage_key(clause.field, metadata_keys)
+        op = clause.op.value
+        value = clause.value
+        if op in ("in", "nin"):
+            if not isinstance(value, list) or not all(isinstance(v, SCALAR_TYPES) for v in value):
+                raise ValueError(f"{clause.field}: '{op}' expects a list of scalars")
+        elif op == "exists":
+            value = bool(value)
+        elif not isinstance(value, SCALAR_TYPES):
+            raise ValueError(f"{clause.field}: value must be a scalar")
+        if clause.field in ENCODED_FIELDS and op != "exists":
+            if op not in EQUALITY_OPS:
+                raise ValueError(f"{clause.field}: only eq, ne, in, nin and exists are supported")
+            if op in ("in", "nin"):
+                codes = [await lookup(db, clause.field, v) for v in value]
+                value = [code for code in codes if code is not None]
+            else:
+                code = await lookup(db, clause.field, value)
+                # A value that was never stored matches nothing; -1 is no code.
+                value = -1 if code is None else code
+        if key.startswith("m."):
+            used_metadata.add(key[2:])
+        match.setdefault(key, {})[MONGO_OPS[op]] = value
+    return match, used_metadata
+
+
+def group_pipeline(match: dict, group_keys: list[str], limit: int | None) -> list[dict]:
+    """
+    Group keys are storage paths; they are aliased g0, g1, ... because
+    $group _id sub-fields cannot contain dots.
+    """
+    pipeline = [{"$match": match}]
+    if group_keys:
+        pipeline.append({
+            "$group": {
+                "_id": {f"g{i}": f"${key}" for i, key in enumerate(group_keys)},
+                "count": {"$sum": 1},
+            }
+        })
+        pipeline.append({"$sort": {"count": -1}})
+        if limit:
+            pipeline.append({"$limit": limit})
+    else:
+        pipeline.append({"$count": "count"})
+    return pipeline
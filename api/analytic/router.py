@@ -5,28 +5,86 @@ from fastapi import (
     Depends,
     Query,
     HTTPException,
-    BackgroundTasks
+    BackgroundTasks,
+    Header,
+    Request,
+    Response
 )
-from backend.api.analytic.analytic_service import AnalyticsService
+from fastapi.responses import StreamingResponse
+from backend.api.analytic.analytic_service import (
+    AnalyticsService,
+    aggregation_limiter,
+    event_partitions,
+    ingest_rate_limiter,
+    ingest_watermark,
+    live_counters,
+    query_rate_limiter,
+    session_aggregator
+)
+from backend.api.analytic.cohorts import activity_bitmaps
+from backend.api.analytic.dedup import event_deduplicator
+from backend.api.analytic.ingest_decoder import EVENT_BODY_OPENAPI, IngestError, decode_event
+from backend.api.analytic.watermark import ConditionalGet
 from backend.api.analytic.schemas.request import (
-    EventCreate,
-    Event,
+    AdHocQuery,
+    BatchQuery,
+    FunnelRequest,
     Metric
 )
 from backend.utils.auth import JWTBearer
+from backend.utils.query_guard import QueryGuard
+from backend.utils.rate_limit import RateLimit
+from pymongo.errors import ExecutionTimeout
 from datetime import timezone
-from backend.utils.mongodb import get_db
+from backend.utils.mongodb import get_db, get_read_db
+from backend.utils.settings import get_settings
+import json
 import os
 
 router = APIRouter()
 
+# Validators for reads whose results only change when events are ingested,
+# and for reads over a window that slides with the clock.
+fresh_since_ingest = ConditionalGet(ingest_watermark)
+fresh_sliding = ConditionalGet(ingest_watermark, get_settings().CONDITIONAL_GET_SLIDING_SECONDS)
+
+# Per-token request budgets; ingestion and queries are limited separately.
+ingest_quota = RateLimit(ingest_rate_limiter)
+query_quota = RateLimit(query_rate_limiter)
+
+
+def query_guard(endpoint: str, limited: bool = True, budget_ms: int | None = None) -> QueryGuard:
+    """
+    Time budget for an endpoint's reads (QUERY_BUDGETS_MS overrides the
+    default); expensive aggregations also take an aggregation_limiter slot.
+    """
+    settings = get_settings()
+    budget_ms = settings.QUERY_BUDGETS_MS.get(endpoint, budget_ms or settings.QUERY_BUDGET_MS)
+    return QueryGuard(budget_ms, aggregation_limiter if limited else None)
+
+
+def sample_rate(response: Response, approx: bool = Query(
+    False,
+    description="Estimate from a sample of events; counts then carry a ci95 interval"
+)) -> float | None:
+    """Sample rate for approx=true, also reported in X-Sample-Rate."""
+    if not approx:
+        return None
+    rate = get_settings().APPROX_SAMPLE_RATE
+    response.headers["X-Sample-Rate"] = str(rate)
+    return rate
+
 
 @router.get("/events/timeseries")
 async def events_timeseries(
     interval: str = Query("day", pattern="^(day|hour)$"),
     days: int = Query(7, ge=1, le=90),
     token: str = Depends(JWTBearer()),
-    db=Depends(get_db)
+    quota: None = Depends(query_quota),
+    validators: None = Depends(fresh_sliding),
+    guard: None = Depends(query_guard("events_timeseries")),
+    rate: float | None = Depends(sample_rate),
+    db=Depends(get_read_db)
 ):
     """
     Time-series analytics
@@ -37,7 +95,8 @@ async def events_timeseries(
         interval,
         start,
         end,
-        db
+        db,
+        rate
     )
 
 @router.get("/events/grouped")
@@ -47,44 +106,96 @@ async def events_grouped(
             description="Field to group events by",
             example="event_name"
         ),
+    limit: int | None = Query(None, ge=1, le=10000, description="Return only the top groups"),
     token: str = Depends(JWTBearer()),
-    db=Depends(get_db)
+    quota: None = Depends(query_quota),
+    validators: None = Depends(fresh_since_ingest),
+    guard: None = Depends(query_guard("events_grouped")),
+    rate: float | None = Depends(sample_rate),
+    db=Depends(get_read_db)
 ):
     """
     Group events by field
     """
-    return await AnalyticsService.events_grouped_by(by, db)
+    return await AnalyticsService.events_grouped_by(by, db, limit, rate)
+
+
+@router.get("/events/top")
+async def events_top(
+    by: Literal["event_name", "event_category", "source", "user_id"] = Query(
+            ...,
+            description="Field to rank",
+            example="event_name"
+        ),
+    n: int = Query(10, ge=1, le=100),
+    hours: int = Query(24, ge=1, le=24 * 90),
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    db=Depends(get_read_db)
+):
+    """
+    Approximate top-N keys with error bounds (hour granularity)
+    """
+    end = datetime.now(timezone.utc)
+    return await AnalyticsService.top_keys(by, end - timedelta(hours=hours), end, n, db)
 
 @router.get("/events/count")
-async def get_count_events(token: str = Depends(JWTBearer()), db=Depends(get_db)):
+async def get_count_events(
+    days: int = Query(1, ge=1, le=90),
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    validators: None = Depends(fresh_sliding),
+    guard: None = Depends(query_guard("events_count", limited=False)),
+    rate: float | None = Depends(sample_rate),
+    db=Depends(get_read_db)
+):
     try:
-        filters = {"created_at": {"$gte": datetime.now(timezone.utc) - timedelta(days=1)}}
-        count = await AnalyticsService.count_events(filters, db)
-        return {"count": count}
+        filters = {"created_at": {"$gte": datetime.now(timezone.utc) - timedelta(days=days)}}
+        count = await AnalyticsService.count_events(filters, db, rate)
+        return count if rate is not None else {"count": count}
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         return {"error": str(e)}
 
 @router.get("/events/daily")
-async def daily_events(token: str = Depends(JWTBearer()), db = Depends(get_db)):
+async def daily_events(
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    validators: None = Depends(fresh_sliding),
+    guard: None = Depends(query_guard("events_daily", limited=False)),
+    db=Depends(get_read_db)
+):
     today = datetime.utcnow() - timedelta(days=1)
     filters = {"created_at": {"$gte": today}}
     count = await AnalyticsService.daily_events(filters,db)
     return {"daily_events": count}
 
 
-@router.post("/events", status_code=202)
+@router.post("/events", status_code=202, openapi_extra=EVENT_BODY_OPENAPI)
 async def create_event(
-    payload: EventCreate,
+    request: Request,
     background_tasks: BackgroundTasks,
-    token: str = Depends(JWTBearer()),
+    idempotency_key: str | None = Header(None, max_length=128),
+    token: dict = Depends(JWTBearer()),
+    quota: None = Depends(ingest_quota),
     db=Depends(get_db)
 ):
     """
-    Track analytics event (async background ingestion)
+    Track analytics event (async background ingestion).
+    Retries carrying the same Idempotency-Key header are stored once.
     """
-    event = Event(**payload.model_dump())
+    key = f"{token['sub']}:{idempotency_key}" if idempotency_key else None
+    try:
+        # Decoded straight from the raw body; see ingest_decoder.
+        event = decode_event(await request.body(), key)
+    except IngestError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if key and await event_deduplicator.is_duplicate(key, event_partitions, db):
+        return {
+            "status": "duplicate",
+            "message": "Event already ingested"
+        }
     background_tasks.add_task(
         AnalyticsService.create_event, event, db
     )
@@ -94,6 +205,49 @@ async def create_event(
     }
 
 
+@router.get("/events/dedup")
+async def dedup_stats(token: str = Depends(JWTBearer())):
+    """
+    Idempotency-key de-duplication counters of this process
+    """
+    return event_deduplicator.stats()
+
+
+@router.get("/events/live")
+async def live_events(request: Request, token: str = Depends(JWTBearer())):
+    """
+    Server-Sent Events stream of per-second/per-minute event counters
+    """
+    try:
+        subscriber = live_counters.subscribe()
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    keepalive = get_settings().LIVE_KEEPALIVE_SECONDS
+
+    async def stream():
+        try:
+            yield f"data: {json.dumps(live_counters.snapshot())}\n\n"
+            while not await request.is_disconnected():
+                message = await subscriber.next(keepalive)
+                yield ": keepalive\n\n" if message is None else f"data: {message}\n\n"
+        finally:
+            live_counters.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/events/live/stats")
+async def live_stats(token: str = Depends(JWTBearer())):
+    """
+    Live stream subscribers and coalesced (skipped) updates
+    """
+    return live_counters.stats()
+
+
 @router.get("/events")
 async def list_events(
     event_name: str | None = None,
@@ -103,7 +257,10 @@ async def list_events(
     page: int = Query(1, ge=1),
     limit: int = Query(20, le=100),
     token: str = Depends(JWTBearer()),
-    db=Depends(get_db)
+    quota: None = Depends(query_quota),
+    validators: None = Depends(fresh_since_ingest),
+    guard: None = Depends(query_guard("list_events", limited=False)),
+    db=Depends(get_read_db)
 ):
     """
     List events with filters & pagination
@@ -120,7 +277,12 @@ async def list_events(
 
 
 @router.get("/events/{event_id}")
-async def get_event(event_id: str, token: str = Depends(JWTBearer()), db=Depends(get_db)):
+async def get_event(
+    event_id: str,
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    db=Depends(get_read_db)
+):
     """
     Get single event by ID
     """
@@ -134,7 +296,10 @@ async def get_event(event_id: str, token: str = Depends(JWTBearer()), db=Depends
 async def active_users(
     range: str = Query("day", pattern="^(day|week|month)$"),
     token: str = Depends(JWTBearer()),
-    db=Depends(get_db)
+    quota: None = Depends(query_quota),
+    validators: None = Depends(fresh_sliding),
+    guard: None = Depends(query_guard("active_users")),
+    db=Depends(get_read_db)
 ):
     """
     Active users (DAU / WAU / MAU)
@@ -153,11 +318,99 @@ async def active_users(
     }
 
 
+@router.post("/funnels")
+async def funnels(
+    payload: FunnelRequest,
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    guard: None = Depends(query_guard("funnels")),
+    db=Depends(get_read_db)
+):
+    """
+    Conversion funnel over an ordered list of event names
+    """
+    return await AnalyticsService.funnel(
+        payload.steps,
+        payload.window_seconds,
+        payload.start,
+        payload.end,
+        db
+    )
+
+
+@router.get("/retention")
+async def retention(
+    interval: str = Query("day", pattern="^(day|week)$"),
+    cohorts: int = Query(30, ge=1, le=90),
+    periods: int = Query(30, ge=1, le=90),
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    db=Depends(get_read_db)
+):
+    """
+    Cohort retention matrix (users first seen per day/week and their return)
+    """
+    return await activity_bitmaps.retention_matrix(db, interval, cohorts, periods)
+
+
+@router.get("/sessions/stats")
+async def session_stats(
+    interval: str = Query("day", pattern="^(day|hour)$"),
+    days: int = Query(7, ge=1, le=90),
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    db=Depends(get_read_db)
+):
+    """
+    Session counts, average duration and bounce rate over time
+    """
+    end = datetime.now(timezone.utc)
+    return await session_aggregator.stats(db, interval, end - timedelta(days=days), end)
+
+
+@router.post("/query")
+async def adhoc_query(
+    payload: AdHocQuery,
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    guard: None = Depends(query_guard("query", budget_ms=get_settings().QUERY_MAX_TIME_MS)),
+    db=Depends(get_read_db)
+):
+    """
+    Filter and group events by fields and whitelisted metadata keys
+    """
+    try:
+        return await AnalyticsService.adhoc_query(payload, db)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ExecutionTimeout:
+        raise HTTPException(status_code=504, detail="Query exceeded its time budget")
+
+
+@router.post("/query/batch")
+async def batch_query(
+    payload: BatchQuery,
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    guard: None = Depends(query_guard("query_batch")),
+    db=Depends(get_read_db)
+):
+    """
+    Answer several dashboard widgets (count, daily, grouped, timeseries,
+    active_users) in one request
+    """
+    try:
+        return await AnalyticsService.batch_query(payload.queries, db)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @router.post("/metrics", status_code=201)
 async def create_metric(
     payload: Metric,
     background_tasks: BackgroundTasks,
     token: str = Depends(JWTBearer()),
+    quota: None = Depends(ingest_quota),
     db=Depends(get_db)
 ):
     """
@@ -174,7 +427,12 @@ async def create_metric(
 
 
 @router.get("/metrics/weather")
-async def fetch_weather(city: str, token: str = Depends(JWTBearer()), db=Depends(get_db)):
+async def fetch_weather(
+    city: str,
+    token: str = Depends(JWTBearer()),
+    quota: None = Depends(query_quota),
+    db=Depends(get_db)
+):
     """
    Fetch weather metric from OpenWeatherMap API and store it.
     """
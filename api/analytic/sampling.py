@@ -0,0 +1,129 @@
+import asyncio
+import math
+import time
+import zlib
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# Events carry a sample key ``h`` in [0, SAMPLE_BUCKETS); the events with
+# h < rate * SAMPLE_BUCKETS form a deterministic sample of that rate.
+SAMPLE_BUCKETS = 10_000
+# Serves every sampled query shape: the time range is bounded under the
+# h prefix and the group-by fields are read from the index.
+SAMPLE_INDEX = "h_1_t_-1_n_1_c_1_src_1"
+Z_95 = 1.96
+
+
+def sample_key(event_id) -> int:
+    data = event_id.binary if isinstance(event_id, ObjectId) else str(event_id).encode()
+    return zlib.crc32(data) % SAMPLE_BUCKETS
+
+
+def sample_buckets(rate: float) -> int:
+    return min(SAMPLE_BUCKETS, max(1, round(rate * SAMPLE_BUCKETS)))
+
+
+def sample_filter(rate: float) -> dict:
+    return {"h": {"$lt": sample_buckets(rate)}}
+
+
+def estimate(sampled: int, rate: float, exact: int = 0) -> dict:
+    """
+    Scale a sampled count back up, with a 95% confidence interval. Each
+    event is in the sample independently with probability ``p``, so the
+    sampled count is binomial: Var = N p (1 - p), estimated from the
+    sample. ``exact`` is added unscaled (e.g. counts from the archive).
+    """
+    p = sample_buckets(rate) / SAMPLE_BUCKETS
+    count = sampled / p
+    if sampled == 0:
+        # Rule of three: 95% upper bound when nothing was observed.
+        low, high = 0.0, 3 / p
+    else:
+        margin = Z_95 * math.sqrt(sampled * (1 - p)) / p
+        low, high = max(0.0, count - margin), count + margin
+    return {
+        "count": round(count) + exact,
+        "ci95": [math.floor(low) + exact, math.ceil(high) + exact],
+    }
+
+
+def exact(count: int) -> dict:
+    """Estimate shape for a count that was not sampled."""
+    return {"count": count, "ci95": [count, count]}
+
+
+class SampleCoverage:
+    """
+    Which partitions can be sampled: those with SAMPLE_INDEX where every
+    event has a sample key. Partitions stored before sampling existed (not
+    indexed or not backfilled yet) are counted exactly instead. A partition
+    that is ready stays ready, since new events always get ``h``; the others
+    are checked again at most every ``recheck_seconds``.
+    """
+
+    def __init__(self, recheck_seconds: float = 300):
+        self.recheck_seconds = recheck_seconds
+        self._ready: set[str] = set()
+        self._checked_at: dict[str, float] = {}
+
+    async def _is_ready(self, collection) -> bool:
+        name = collection.name
+        if name in self._ready:
+            return True
+        now = time.monotonic()
+        checked_at = self._checked_at.get(name)
+        if checked_at is not None and now - checked_at < self.recheck_seconds:
+            return False
+        self._checked_at[name] = now
+        if SAMPLE_INDEX not in await collection.index_information():
+            return False
+        if await collection.find_one({"h": {"$exists": False}}, {"_id": 1}, hint=SAMPLE_INDEX):
+            return False
+        self._ready.add(name)
+        self._checked_at.pop(name, None)
+        return True
+
+    async def split(self, collections) -> tuple[list, list]:
+        """Split partitions into (sampled, counted exactly)."""
+        ready = await asyncio.gather(*(self._is_ready(c) for c in collections))
+        sampled = [c for c, ok in zip(collections, ready) if ok]
+        unsampled = [c for c, ok in zip(collections, ready) if not ok]
+        return sampled, unsampled
+
+
+async def backfill(db, partitions, batch_size: int = 1000) -> int:
+    """
+    Set the sample key on events stored before it existed. Safe to re-run.
+    """
+    updated = 0
+    for collection in await partitions.collections_for_range(db, None, None):
+        batch = []
+        async for doc in collection.find({"h": {"$exists": False}}, {"_id": 1}):
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"h": sample_key(doc["_id"])}}))
+            if len(batch) == batch_size:
+                await collection.bulk_write(batch, ordered=False)
+                updated += len(batch)
+                batch = []
+        if batch:
+            await collection.bulk_write(batch, ordered=False)
+            updated += len(batch)
+    return updated
+
+
+if __name__ == "__main__":
+    import asyncio
+    from backend.api.analytic.analytic_service import event_partitions
+    from backend.utils.mongodb import connect_to_mongo, close_mongo, ensure_collection_indexes, get_db
+
+    async def _backfill() -> None:
+        await connect_to_mongo()
+        try:
+            db = get_db()
+            for collection in await event_partitions.collections_for_range(db, None, None):
+                await ensure_collection_indexes(collection, event_partitions.indexes, event_partitions.redundant)
+            print(await backfill(db, event_partitions))
+        finally:
+            await close_mongo()
+
+    asyncio.run(_backfill())
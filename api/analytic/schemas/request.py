@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, Dict
+from typing import Any, Literal, Optional, Dict, List
 from pydantic import BaseModel, Field
 
 class Source(str, Enum):
@@ -17,6 +17,7 @@ class Event(BaseModel):
     session_id: Optional[str] = Field(...)
     source: Source = Field(...)  # web, mobile, backend
     metadata: Dict = {}
+    idempotency_key: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Metric(BaseModel):
@@ -32,3 +33,45 @@ class EventCreate(BaseModel):
     source: Source = Field(...)
     user_id: Optional[str]
     session_id: Optional[str]
+    metadata: Dict = {}
+
+class FunnelRequest(BaseModel):
+    steps: List[str] = Field(..., min_length=2, max_length=20, description="Ordered event names")
+    window_seconds: int = Field(86400, ge=1, le=90 * 86400, description="Max time from first to last step")
+    start: datetime = Field(...)
+    end: Optional[datetime] = None
+
+class FilterOp(str, Enum):
+    eq = "eq"
+    ne = "ne"
+    in_ = "in"
+    nin = "nin"
+    gt = "gt"
+    gte = "gte"
+    lt = "lt"
+    lte = "lte"
+    exists = "exists"
+
+class QueryFilter(BaseModel):
+    field: str = Field(..., description="Top-level field or whitelisted metadata.<key>", example="metadata.plan")
+    op: FilterOp = FilterOp.eq
+    value: Any = None
+
+class AdHocQuery(BaseModel):
+    filters: List[QueryFilter] = Field([], max_length=10)
+    group_by: List[str] = Field([], max_length=3)
+    start: datetime = Field(...)
+    end: Optional[datetime] = None
+    limit: int = Field(100, ge=1, le=1000)
+
+class BatchQueryItem(BaseModel):
+    id: str = Field(..., description="Echoed back as the result key", example="dau")
+    type: Literal["count", "daily", "grouped", "timeseries", "active_users"]
+    by: Optional[Literal["event_name", "event_category", "source"]] = None  # grouped
+    limit: Optional[int] = Field(None, ge=1, le=10000)  # grouped
+    interval: Literal["day", "hour"] = "day"  # timeseries
+    days: int = Field(7, ge=1, le=90)  # timeseries
+    range: Literal["day", "week", "month"] = "day"  # active_users
+
+class BatchQuery(BaseModel):
+    queries: List[BatchQueryItem] = Field(..., min_length=1, max_length=50)
@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from backend.utils.cache import LRUCache
+
+log = logging.getLogger("analytic_server.sessions")
+
+BUCKET_FORMAT = {"day": "%Y-%m-%d", "hour": "%Y-%m-%d %H"}
+
+
+def session_indexes(retention_days: int) -> list[IndexModel]:
+    if retention_days > 0:
+        # Serves session_stats and expires sessions with the event partitions.
+        return [IndexModel(
+            [("start", ASCENDING)],
+            name="start_1",
+            expireAfterSeconds=retention_days * 86400
+        )]
+    return [IndexModel([("start", ASCENDING)], name="start_1")]
+
+
+def open_session_indexes(idle_timeout_seconds: int) -> list[IndexModel]:
+    # A user idle for longer than the timeout starts a new session anyway;
+    # the extra day leaves room for events that arrive late.
+    return [IndexModel(
+        [("end", ASCENDING)],
+        name="end_1",
+        expireAfterSeconds=idle_timeout_seconds + 86400
+    )]
+
+
+def _client_session(session_id: str) -> str:
+    """
+    Client session ids starting with "~" (or the "%" escape itself) get a
+    "%" prefix, so they cannot collide with synthetic ``<user>:~<ts>`` keys.
+    """
+    return f"%{session_id}" if session_id.startswith(("~", "%")) else session_id
+
+
+class SessionAggregator:
+    """
+    Maintains one ``session`` document per session (start, end, event count)
+    from the ingestion path, so session metrics never scan raw events.
+
+    Events carrying a session_id are grouped by (user, session_id). Events
+    without one are assigned to a synthetic per-user session that is split
+    after ``idle_timeout`` of inactivity. The open synthetic session of each
+    user is kept in ``session_open`` and advanced atomically, so every
+    worker assigns a user's events to the same session. Updates are
+    buffered in memory and applied with $min/$max/$inc upserts on ``flush``.
+    """
+
+    def __init__(self, idle_timeout_seconds: int, cache_size: int = 100_000):
+        self.idle_timeout = timedelta(seconds=idle_timeout_seconds)
+        # user -> (synthetic session key, end as last seen in session_open)
+        self._open = LRUCache(cache_size)
+        self._pending: dict[str, dict] = {}
+
+    async def _synthetic_key(self, db, user: str, at: datetime) -> str:
+        current = self._open.get(user)
+        # An event inside the span already seen belongs to that session and
+        # does not move its end.
+        if current is not None and current[1] - self.idle_timeout <= at <= current[1]:
+            return current[0]
+        is_open = {"$gte": ["$end", at - self.idle_timeout]}
+        session = await db.session_open.find_one_and_update(
+            {"_id": user},
+            [{
+                "$set": {
+                    # $literal: a user id starting with "$" is not a field path.
+                    "key": {"$cond": [is_open, "$key", {"$literal": f"{user}:~{int(at.timestamp())}"}]},
+                    "end": {"$cond": [is_open, {"$max": ["$end", at]}, at]},
+                }
+            }],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        end = session["end"]
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        self._open.set(user, (session["key"], end))
+        return session["key"]
+
+    async def record(self, db, doc: dict) -> None:
+        """
+        Account a stored (compact) event document to its session.
+        """
+        user, session_id, at = doc.get("u"), doc.get("s"), doc["t"]
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        if session_id is not None:
+            key, synthetic = f"{user or ''}:{_client_session(session_id)}", False
+        elif user is not None:
+            key, synthetic = await self._synthetic_key(db, user, at), True
+        else:
+            return
+        self._merge(key, {"u": user, "synthetic": synthetic, "start": at, "end": at, "n": 1})
+
+    async def flush(self, db) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await db.session.bulk_write(self._operations(pending), ordered=False)
+        except Exception:
+            # Keep the updates for the next flush.
+            for key, session in pending.items():
+                self._merge(key, session)
+            raise
+
+    def _merge(self, key: str, session: dict) -> None:
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = session
+        else:
+            pending["start"] = min(pending["start"], session["start"])
+            pending["end"] = max(pending["end"], session["end"])
+            pending["n"] += session["n"]
+
+    @staticmethod
+    def _operations(pending: dict[str, dict]) -> list[UpdateOne]:
+        return [
+            UpdateOne(
+                {"_id": key},
+                {
+                    "$setOnInsert": {"u": session["u"], "synthetic": session["synthetic"]},
+                    "$min": {"start": session["start"]},
+                    "$max": {"end": session["end"]},
+                    "$inc": {"n": session["n"]},
+                },
+                upsert=True
+            )
+            for key, session in pending.items()
+        ]
+
+    @staticmethod
+    async def stats(db, interval: str, start: datetime, end: datetime) -> list[dict]:
+        """
+        Sessions started per bucket with average duration and bounce rate
+        (share of single-event sessions).
+        """
+        pipeline = [
+            {"$match": {"start": {"$gte": start, "$lte": end}}},
+            {
+                "$group": {
+                    "_id": {"$dateToString": {"format": BUCKET_FORMAT[interval], "date": "$start"}},
+                    "sessions": {"$sum": 1},
+                    "duration_ms": {"$avg": {"$subtract": ["$end", "$start"]}},
+                    "bounces": {"$sum": {"$cond": [{"$eq": ["$n", 1]}, 1, 0]}},
+                }
+            },
+            {"$sort": {"_id": 1}}
+        ]
+        results = await db.session.aggregate(pipeline).to_list(length=None)
+        return [
+            {
+                "bucket": r["_id"],
+                "sessions": r["sessions"],
+                "avg_duration_seconds": round((r["duration_ms"] or 0) / 1000, 3),
+                "bounce_rate": round(r["bounces"] / r["sessions"], 4),
+            }
+            for r in results
+        ]
@@ -0,0 +1,170 @@
+import heapq
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+
+log = logging.getLogger("analytic_server.topk")
+
+# API field -> storage key, for the fields tracked by heavy-hitter sketches.
+TOPK_FIELDS = {
+    "event_name": "n",
+    "event_category": "c",
+    "source": "src",
+    "user_id": "u",
+}
+
+
+def topk_indexes(retention_days: int) -> list[IndexModel]:
+    options = {"expireAfterSeconds": retention_days * 86400} if retention_days > 0 else {}
+    return [IndexModel([("b", ASCENDING), ("f", ASCENDING)], name="b_1_f_1", **options)]
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary with at most ``capacity`` counters.
+    Each tracked count overestimates the true count by at most its error,
+    and any untracked key occurred at most ``min_count`` times.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters: dict = {}  # key -> [count, error]
+        self._heap: list = []  # lazy (count, key) min-heap, may hold stale entries
+
+    def add(self, key, weight: int = 1) -> None:
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0]
+            heapq.heappush(self._heap, (weight, key))
+            return
+        # Replace the smallest counter; the newcomer inherits its count as error.
+        while True:
+            count, smallest = heapq.heappop(self._heap)
+            counter = self.counters.get(smallest)
+            if counter is None:
+                continue  # entry of an already evicted key
+            if counter[0] == count:
+                break
+            heapq.heappush(self._heap, (counter[0], smallest))
+        del self.counters[smallest]
+        self.counters[key] = [count + weight, count]
+        heapq.heappush(self._heap, (count + weight, key))
+
+    @property
+    def full(self) -> bool:
+        return len(self.counters) >= self.capacity
+
+    @property
+    def min_count(self) -> int:
+        if not self.full:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def to_document(self) -> dict:
+        return {
+            "cap": self.capacity,
+            "min": self.min_count,
+            "counters": [[key, count, error] for key, (count, error) in self.counters.items()],
+        }
+
+
+def merge_summaries(documents: list[dict], n: int) -> list[dict]:
+    """
+    Merge persisted summaries into the top ``n`` keys with bounds: ``count``
+    is an upper bound of the true count and ``lower`` a lower bound.
+    """
+    upper: dict = {}
+    lower: dict = {}
+    for doc in documents:
+        for key, count, error in doc["counters"]:
+            upper[key] = upper.get(key, 0) + count
+            lower[key] = lower.get(key, 0) + count - error
+    # A key missing from a full summary may still have occurred up to that
+    # summary's smallest count.
+    for doc in documents:
+        if doc["min"]:
+            present = {counter[0] for counter in doc["counters"]}
+            for key in upper:
+                if key not in present:
+                    upper[key] += doc["min"]
+    top = heapq.nlargest(n, upper.items(), key=lambda item: item[1])
+    return [
+        {"key": key, "count": count, "lower": lower[key], "error": count - lower[key]}
+        for key, count in top
+    ]
+
+
+class TopKSketches:
+    """
+    Hourly Space-Saving summaries per field, updated at ingest. Every process
+    writes its own summary documents, and queries merge all summaries of the
+    hours overlapping the range, so results are exact to hour granularity in
+    time and within the reported error bounds in counts.
+    """
+
+    # Buckets older than this are dropped from memory after a flush; later
+    # events for them are not counted.
+    OPEN_BUCKETS = timedelta(hours=3)
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.instance = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._buckets: dict[tuple[str, datetime], SpaceSaving] = {}
+        self._dirty: set[tuple[str, datetime]] = set()
+
+    @staticmethod
+    def bucket_of(moment: datetime) -> datetime:
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    def record(self, doc: dict) -> None:
+        """
+        Count a stored (compact) event document.
+        """
+        bucket = self.bucket_of(doc["t"])
+        if bucket < self.bucket_of(datetime.now(timezone.utc)) - self.OPEN_BUCKETS:
+            return
+        for field, key in TOPK_FIELDS.items():
+            value = doc.get(key)
+            if value is None:
+                continue
+            summary = self._buckets.get((field, bucket))
+            if summary is None:
+                summary = self._buckets[(field, bucket)] = SpaceSaving(self.capacity)
+            summary.add(value)
+            self._dirty.add((field, bucket))
+
+    async def flush(self, db) -> None:
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            operations = [
+                ReplaceOne(
+                    {"_id": f"{field}:{bucket:%Y%m%d%H}:{self.instance}"},
+                    {"f": field, "b": bucket, "i": self.instance, **self._buckets[(field, bucket)].to_document()},
+                    upsert=True
+                )
+                for field, bucket in dirty
+            ]
+            try:
+                await db.topk.bulk_write(operations, ordered=False)
+            except Exception:
+                # Rewrite these buckets on the next flush; they stay in memory
+                # until one succeeds.
+                self._dirty |= dirty
+                raise
+        oldest = self.bucket_of(datetime.now(timezone.utc)) - self.OPEN_BUCKETS
+        for key in [key for key in self._buckets if key[1] < oldest]:
+            del self._buckets[key]
+
+    @staticmethod
+    async def top(db, field: str, start: datetime, end: datetime, n: int) -> list[dict]:
+        query = {"f": field, "b": {"$gte": TopKSketches.bucket_of(start), "$lte": end}}
+        documents = await db.topk.find(query, {"counters": 1, "min": 1}).to_list(length=None)
+        return merge_summaries(documents, n)
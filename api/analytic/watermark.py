@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Depends, HTTPException, Request, Response
+from backend.utils.mongodb import get_read_db
+
+
+def _utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+class IngestWatermark:
+    """
+    Version of the stored events: the document counts of all partitions
+    (estimated_document_count, read from collection metadata) plus the
+    inserts of this process since they were last read. Every insert
+    changes it, including events stored out of order under an older
+    time, and so does retention. Counts are re-read at most every
+    ``refresh_seconds``, so writes by other processes are picked up too.
+    ``modified_at`` is when this process last saw the version change.
+    """
+
+    def __init__(self, partitions, refresh_seconds: float):
+        self.partitions = partitions
+        self.refresh_seconds = refresh_seconds
+        self._counts: tuple = ()
+        self._pending = 0
+        self._modified_at: datetime | None = None
+        self._refreshed_at: float | None = None
+
+    def advance(self) -> None:
+        self._pending += 1
+        self._modified_at = datetime.now(timezone.utc)
+
+    async def _refresh(self, db) -> None:
+        collections = await self.partitions.collections_for_range(db, None, None)
+        totals = await asyncio.gather(*(c.estimated_document_count() for c in collections))
+        counts = tuple(zip((c.name for c in collections), totals))
+        # Unchanged if the only new events are the ones counted locally.
+        expected = sum(total for _, total in self._counts) + self._pending
+        if (
+            [name for name, _ in counts] != [name for name, _ in self._counts]
+            or sum(totals) != expected
+            or self._modified_at is None
+        ):
+            self._modified_at = datetime.now(timezone.utc)
+        self._counts = counts
+        self._pending = 0
+
+    async def current(self, db) -> tuple[str, datetime | None]:
+        """The version string and the time it last changed."""
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            self._refreshed_at = time.monotonic()
+            await self._refresh(db)
+        total = sum(count for _, count in self._counts) + self._pending
+        version = ",".join(name for name, _ in self._counts) + f":{total}"
+        return version, self._modified_at
+
+
+class ConditionalGet:
+    """
+    Dependency adding ETag/Last-Modified validators derived from the ingest
+    watermark, and answering 304 before the query runs when the client's
+    copy is still current.
+
+    Results over a sliding window ("last 7 days") change as time passes
+    even without new events; ``sliding_seconds`` also rolls the ETag at
+    that period for such endpoints.
+    """
+
+    def __init__(self, watermark: IngestWatermark, sliding_seconds: int = 0):
+        self.watermark = watermark
+        self.sliding_seconds = sliding_seconds
+
+    async def __call__(self, request: Request, response: Response, db=Depends(get_read_db)) -> None:
+        version, modified_at = await self.watermark.current(db)
+        state = [
+            request.url.path,
+            str(sorted(request.query_params.multi_items())),
+            version,
+        ]
+        if self.sliding_seconds:
+            state.append(str(int(time.time()) // self.sliding_seconds))
+        etag = '"' + hashlib.sha1("|".join(state).encode()).hexdigest()[:20] + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if modified_at is not None and not self.sliding_seconds:
+            headers["Last-Modified"] = format_datetime(modified_at, usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in candidates or etag in candidates:
+                raise HTTPException(status_code=304, headers=headers)
+        elif "Last-Modified" in headers and request.headers.get("if-modified-since"):
+            try:
+                since = parsedate_to_datetime(request.headers["if-modified-since"])
+            except (TypeError, ValueError):
+                since = None
+            # HTTP dates have second precision.
+            if since is not None and modified_at.replace(microsecond=0) <= _utc(since):
+                raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
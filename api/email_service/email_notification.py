@@ -1,5 +1,3 @@
-import smtplib
-from email.message import EmailMessage
 from backend.utils.settings import Settings
 import logging
 
@@ -10,6 +8,9 @@ logger = logging.getLogger(__name__)
 class EmailService:
     @staticmethod
     def send_email(to_email: str, subject: str, message: str) -> None:
+        # Imported here: mail is only sent from background tasks.
+        import smtplib
+        from email.message import EmailMessage
         try:
             msg = EmailMessage()
             msg["From"] = settings.SMTP_FROM
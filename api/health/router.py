@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Request, status
+from starlette.responses import JSONResponse
+from backend.utils.mongodb import ping
+from backend.utils.aiohttp_client import aiohttp_client_session
+from backend.api.analytic.analytic_service import (
+    aggregation_limiter,
+    hot_window,
+    ingest_rate_limiter,
+    query_rate_limiter
+)
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness(request: Request):
+    """
+    Readiness probe: startup finished and MongoDB is reachable.
+    """
+    state = request.app.state
+    ready = getattr(state, "ready", False) and await ping()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "startup": state.startup.as_dict() if hasattr(state, "startup") else None,
+            "http_client": aiohttp_client_session.health(),
+            "hot_window": hot_window.stats(),
+            "aggregations": aggregation_limiter.stats(),
+            "rate_limits": {
+                "ingest": ingest_rate_limiter.stats(),
+                "query": query_rate_limiter.stats()
+            },
+        },
+    )
@@ -2,11 +2,13 @@ import json
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from starlette.responses import JSONResponse
 
 from backend.api.email_service.email_notification import EmailService
 from backend.api.user.schemas.request import CreateUserRequest, LoginRequest
 from backend.api.user.schemas.response import TokenResponse
+from backend.api.user.user_cache import unenforced_fields, user_cache
 from backend.utils.mongodb import get_db
 from backend.utils.password_validation import validate_password
 from backend.utils.password_hashing import hash_password, verify_password
@@ -37,18 +39,11 @@ async def sign_user(
     """
     Register a new user.
     - Validate password
-    - Check if email already exists
     - Hash password securely
-    - Insert user into MongoDB
+    - Insert user into MongoDB; the unique indexes on email and
+      username reject existing users
     """
     validate_password(user.password)
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
-        log.warning(f"Signup attempt with existing email: {user.email}")
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="User with this email already exists",
-        )
     hashed_password = hash_password(user.password)
     user_doc = {
         "email": user.email,
@@ -57,6 +52,13 @@ async def sign_user(
         "is_active": user.is_active,
         "created_at": datetime.utcnow(),
     }
+    for field in sorted(unenforced_fields):
+        # Its unique index is missing (see ensure_user_indexes).
+        if await db.users.find_one({field: user_doc[field]}, {"_id": 1}):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"User with this {field} already exists",
+            )
     try:
         result = await db.users.insert_one(user_doc)
         log.info(f"User created with id: {result.inserted_id}")
@@ -66,6 +68,13 @@ async def sign_user(
             subject="Notification",
             message="User has created successfully"
         )
+    except DuplicateKeyError as e:
+        field = next(iter((e.details or {}).get("keyPattern", {"email": 1})))
+        log.warning(f"Signup attempt with existing {field}: {user_doc[field]}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"User with this {field} already exists",
+        )
     except Exception as e:
         log.error(f"Error inserting user: {e}")
         raise HTTPException(
@@ -86,7 +95,7 @@ async def login(
     user: LoginRequest,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    existing_user = await db.users.find_one({"username": user.username})
+    existing_user = await user_cache.by_username(db, user.username)
     if not existing_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -110,11 +119,10 @@ async def get_user_profile(
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
     user_id = token_payload["sub"]
-    user = await db.users.find_one(
-        {"_id": ObjectId(user_id)},
-        {"password": 0}
-    )
+    user = await user_cache.by_id(db, ObjectId(user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user["_id"] = str(user["_id"])
-    return user
+    # Cached documents are shared; build the response from a copy.
+    profile = {key: value for key, value in user.items() if key != "password"}
+    profile["_id"] = str(profile["_id"])
+    return profile
@@ -0,0 +1,96 @@
+import logging
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from backend.utils.cache import TTLCache
+from backend.utils.mongodb import ensure_collection_indexes
+from backend.utils.settings import get_settings
+
+log = logging.getLogger("analytic_server.users")
+
+# Signup relies on these to reject duplicates in the insert itself;
+# username also serves the login lookup.
+USER_INDEXES = [
+    IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+    IndexModel([("username", ASCENDING)], name="username_1", unique=True),
+]
+DUPLICATE_KEY = 11000
+
+# Fields whose unique index could not be built because existing users
+# share a value. Signup checks them with a lookup until it is fixed.
+unenforced_fields: set[str] = set()
+
+
+async def ensure_user_indexes(db) -> list[str]:
+    """
+    Build the unique user indexes one by one. Signups from before they
+    existed may have left duplicates; those make the build fail, which is
+    logged with the offending values instead of aborting startup.
+    """
+    created = []
+    for index in USER_INDEXES:
+        field = next(iter(index.document["key"]))
+        try:
+            created += await ensure_collection_indexes(db.users, [index])
+        except OperationFailure as e:
+            if e.code != DUPLICATE_KEY:
+                raise
+            duplicates = await db.users.aggregate([
+                {"$group": {"_id": f"${field}", "users": {"$sum": 1}}},
+                {"$match": {"users": {"$gt": 1}}},
+                {"$limit": 20},
+            ]).to_list(length=None)
+            log.error(
+                "Duplicate users prevent a unique index, signup falls back to a lookup "
+                "until they are merged or removed and the service restarted",
+                extra={"index": index.document["name"], "duplicates": duplicates}
+            )
+            unenforced_fields.add(field)
+        else:
+            unenforced_fields.discard(field)
+    return created
+
+
+class UserCache:
+    """
+    Bounded TTL cache of user documents keyed by ``_id``, with a
+    username -> ``_id`` map for logins. Changes made through this process
+    must call ``invalidate``; the TTL bounds how long changes made by other
+    processes can go unseen.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._by_id = TTLCache(maxsize, ttl)
+        self._ids_by_username = TTLCache(maxsize, ttl)
+
+    def _store(self, user: dict) -> dict:
+        self._by_id.set(user["_id"], user)
+        self._ids_by_username.set(user["username"], user["_id"])
+        return user
+
+    async def by_id(self, db, user_id: ObjectId) -> dict | None:
+        user = self._by_id.get(user_id)
+        if user is None:
+            user = await db.users.find_one({"_id": user_id})
+            if user is not None:
+                self._store(user)
+        return user
+
+    async def by_username(self, db, username: str) -> dict | None:
+        user_id = self._ids_by_username.get(username)
+        if user_id is not None:
+            user = self._by_id.get(user_id)
+            if user is not None:
+                return user
+        user = await db.users.find_one({"username": username})
+        if user is not None:
+            self._store(user)
+        return user
+
+    def invalidate(self, user_id: ObjectId) -> None:
+        user = self._by_id.pop(user_id)
+        if user is not None:
+            self._ids_by_username.pop(user["username"])
+
+
+user_cache = UserCache(get_settings().USER_CACHE_SIZE, get_settings().USER_CACHE_TTL_SECONDS)
@@ -0,0 +1,61 @@
+"""
+Per-event CPU of turning a POST /events body into the dict stored by
+AnalyticsService.create_event: the previous pydantic round trips versus
+ingest_decoder.decode_event.
+
+    python -m backend.benchmarks.ingest_decode [--events 50000]
+"""
+import argparse
+import json
+import time
+
+from backend.api.analytic import ingest_decoder
+from backend.api.analytic.schemas.request import Event, EventCreate
+
+BODY = json.dumps({
+    "event_name": "checkout_completed",
+    "event_category": "commerce",
+    "source": "web",
+    "user_id": "user-18342",
+    "session_id": "b1f7c2a0-5d1e-4c1b-9d5e-0a9f3c6e2b11",
+    "metadata": {"plan": "pro", "amount": 49.0, "items": 3, "coupon": None},
+}).encode()
+
+
+def previous_path(body: bytes) -> dict:
+    # Middleware json parse, EventCreate validation, Event re-validation,
+    # and the model_dump in create_event.
+    json.loads(body)
+    payload = EventCreate(**json.loads(body))
+    event = Event(**payload.model_dump(), idempotency_key=None)
+    return event.model_dump()
+
+
+def fast_path(body: bytes) -> dict:
+    return ingest_decoder.decode_event(body)
+
+
+def measure(fn, events: int) -> float:
+    for _ in range(1000):
+        fn(BODY)
+    start = time.process_time()
+    for _ in range(events):
+        fn(BODY)
+    return (time.process_time() - start) / events * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=50_000)
+    args = parser.parse_args()
+
+    before = measure(previous_path, args.events)
+    after = measure(fast_path, args.events)
+    decoder = "msgspec" if ingest_decoder.msgspec is not None else "pydantic validate_json"
+    print(f"previous path : {before:7.2f} us/event")
+    print(f"decode_event  : {after:7.2f} us/event ({decoder})")
+    print(f"speedup       : {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
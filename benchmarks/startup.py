@@ -0,0 +1,84 @@
+"""
+Cold start report: time to import backend.main, broken down by module with
+-X importtime, plus each lifespan step (StartupReport). Exits with status 1
+when import + lifespan exceeds --budget-ms, so CI can enforce the budget.
+
+    python -m backend.benchmarks.startup [--budget-ms 1500] [--top 15] [--no-lifespan]
+
+The lifespan connects to MONGO_URI like the service does.
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from collections import Counter
+
+
+def import_breakdown() -> tuple[list[tuple[str, int]], Counter]:
+    """
+    Modules by cumulative import time and self time per top-level package
+    (microseconds), from a fresh interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    modules = []
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((name, int(cumulative)))
+        package = name.split(".")[0] if not name.startswith("backend.") else ".".join(name.split(".")[:3])
+        packages[package] += int(own)
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return modules, packages
+
+
+async def run_lifespan() -> dict:
+    from backend.main import app, lifespan
+    async with lifespan(app):
+        return app.state.startup.as_dict()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--no-lifespan", action="store_true", help="only measure imports")
+    args = parser.parse_args()
+
+    modules, packages = import_breakdown()
+    print("slowest imports (cumulative, -X importtime):")
+    for name, cumulative in modules[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print("self time by package:")
+    for package, own in packages.most_common(args.top):
+        print(f"  {own / 1000:8.1f} ms  {package}")
+
+    # Measured without -X importtime, which inflates import times.
+    start = time.perf_counter()
+    import backend.main  # noqa: F401
+    import_ms = (time.perf_counter() - start) * 1000
+    print(f"import backend.main : {import_ms:8.1f} ms")
+
+    total_ms = import_ms
+    if not args.no_lifespan:
+        startup = asyncio.run(run_lifespan())
+        for step, ms in startup["steps"].items():
+            print(f"  lifespan {step:<20}: {ms:8.1f} ms")
+        print(f"lifespan            : {startup['total_ms']:8.1f} ms")
+        total_ms += startup["total_ms"]
+
+    print(f"cold start          : {total_ms:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("over budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
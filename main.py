@@ -1,25 +1,131 @@
 import asyncio
 from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse
+from pymongo.errors import ExecutionTimeout, OperationFailure
 from starlette.middleware.base import BaseHTTPMiddleware
 from backend.api.user.router import router as user
 from backend.api.analytic.router import router as analytic
 from backend.api.email_service.router import router as email
+from backend.api.health.router import router as health
 import json_logging
 import time
 import socket
 import logging
 from backend.utils.aiohttp_client import aiohttp_client_session
-from backend.utils.mongodb import connect_to_mongo, close_mongo, get_db
+from backend.utils.mongodb import connect_to_mongo, close_mongo, get_db, warm_up_pool
+from backend.utils.redis import close_redis
 from contextlib import asynccontextmanager
 from backend.utils.mongodb_indexes import create_analytics_indexes
+from backend.utils.compression import CompressionMiddleware
+from backend.utils.startup import StartupReport
+from backend.utils.scheduler import PeriodicTask
+from backend.utils.settings import get_settings
+from backend.api.analytic.analytic_service import (
+    event_archive,
+    event_partitions,
+    hot_window,
+    live_counters,
+    metadata_indexes,
+    session_aggregator,
+    topk_sketches
+)
+from backend.api.analytic.encoding import event_codec
+from backend.api.analytic.cohorts import activity_bitmaps
 
 json_logging.init_fastapi(enable_json=True)
 
+service_start_time = ""
+version:str = "unknown"
+branch:str = "unknown"
+server_hostname:str = socket.gethostname()
+
+log = logging.getLogger("analytic_server")
+
+async def maintain_event_storage(db, settings) -> None:
+    # Archive before retention, so months past both are archived, not lost.
+    await event_archive.archive_expired(db, settings.ARCHIVE_AFTER_DAYS)
+    await event_partitions.maintain(db, settings.EVENT_RETENTION_DAYS)
+    await event_archive.apply_retention(db, settings.EVENT_RETENTION_DAYS)
+
+
+async def flush_ingest_aggregates(db) -> None:
+    await asyncio.gather(
+        activity_bitmaps.flush(db),
+        session_aggregator.flush(db),
+        topk_sketches.flush(db)
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await connect_to_mongo()
+    global service_start_time
+    service_start_time = time.time()
+    startup = StartupReport()
+    app.state.ready = False
+    app.state.startup = startup
+
+    async with startup.step("connect_mongo"):
+        await connect_to_mongo()
+    db = get_db()
+    async with startup.step("warm_up"):
+        await asyncio.gather(
+            create_analytics_indexes(db),
+            warm_up_pool(),
+            event_codec.load(db),
+            metadata_indexes.load(db),
+        )
+    settings = get_settings()
+    partition_maintenance = PeriodicTask(
+        "partition_maintenance",
+        settings.PARTITION_MAINTENANCE_SECONDS,
+        lambda: maintain_event_storage(db, settings)
+    )
+    partition_maintenance.start()
+    ingest_flush = PeriodicTask(
+        "ingest_flush",
+        settings.INGEST_FLUSH_SECONDS,
+        lambda: flush_ingest_aggregates(db)
+    )
+    ingest_flush.start()
+    live_broadcast = PeriodicTask(
+        "live_broadcast",
+        settings.LIVE_PUSH_SECONDS,
+        lambda: live_counters.publish(db)
+    )
+    live_broadcast.start()
+    hot_window_sync = PeriodicTask(
+        "hot_window_sync",
+        settings.HOT_WINDOW_SYNC_SECONDS,
+        lambda: hot_window.sync(event_partitions, db)
+    )
+    if hot_window.enabled:
+        # Backfill in the background; queries use MongoDB until it is loaded.
+        app.state.hot_window_backfill = asyncio.create_task(
+            hot_window.backfill(event_partitions, db)
+        )
+        if settings.HOT_WINDOW_SYNC_SECONDS > 0:
+            hot_window_sync.start()
+    startup.finish()
+    app.state.ready = True
+    log.info(" Analytics Server STARTED", extra={
+        "hostname": server_hostname,
+        "startup_time": service_start_time,
+        "startup_ms": startup.total_ms
+    })
+
     yield
+
+    app.state.ready = False
+    await live_broadcast.stop()
+    await partition_maintenance.stop()
+    await hot_window_sync.stop()
+    await ingest_flush.stop()
+    await flush_ingest_aggregates(db)
+    await aiohttp_client_session.close()
     await close_mongo()
+    await close_redis()
+    log.info("Analytics Server SHUTTING DOWN")
+
 
 app = FastAPI(
     title="Analytics Server",
@@ -32,31 +138,17 @@ app = FastAPI(
 
 json_logging.init_request_instrument(app)
 
-service_start_time = ""
-version:str = "unknown"
-branch:str = "unknown"
-server_hostname:str = socket.gethostname()
 
-log = logging.getLogger("analytic_server")
+@app.exception_handler(ExecutionTimeout)
+async def query_time_budget_exceeded(request: Request, exc: ExecutionTimeout):
+    return JSONResponse(status_code=504, content={"detail": "Query exceeded its time budget"})
 
-async def app_startup():
-    global service_start_time
-    service_start_time = time.time()
-    await aiohttp_client_session.create()
-    db = await get_db()
-    await create_analytics_indexes(db)
-    await connect_to_mongo()
-    log.info(" Analytics Server STARTED", extra={
-        "hostname": server_hostname,
-        "startup_time": service_start_time
-    })
 
-
-async def app_shutdown():
-    await asyncio.sleep(1)
-    await aiohttp_client_session.close()
-    await close_mongo()
-    log.info("Analytics Server SHUTTING DOWN")
+@app.exception_handler(OperationFailure)
+async def query_failed(request: Request, exc: OperationFailure):
+    if exc.code == 11601:  # Interrupted: killed after the client disconnected
+        return JSONResponse(status_code=499, content={"detail": "Client closed request"})
+    raise exc
 
 
 async def capture_body(request: Request):
@@ -69,7 +161,13 @@ async def capture_body(request: Request):
 
 
 class CaptureRequestBodyMiddleware(BaseHTTPMiddleware):
+    # Hot paths that decode their own body; parsing it here would double the work.
+    SKIP = {("POST", "/api/analytics/events")}
+
     async def dispatch(self, request, call_next):
+        if (request.method, request.url.path) in self.SKIP:
+            request.state.request_body = {}
+            return await call_next(request)
         try:
             request.state.request_body = await request.json()
         except Exception:
@@ -91,4 +189,13 @@ app.include_router(email,
                    prefix="/api/email",
                    tags=["email"])
 
-app.add_middleware(CaptureRequestBodyMiddleware)
\ No newline at end of file
+app.include_router(health,
+                   prefix="/health",
+                   tags=["health"])
+
+app.add_middleware(CaptureRequestBodyMiddleware)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=get_settings().COMPRESSION_MIN_BYTES,
+    offload_size=get_settings().COMPRESSION_OFFLOAD_BYTES
+)
\ No newline at end of file
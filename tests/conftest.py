@@ -0,0 +1,30 @@
+"""
+The code is imported as the ``backend`` package. When the checkout has
+another name, a ``backend`` link to it is put in a temporary directory on
+sys.path.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parents[1]
+
+if REPO.name == "backend":
+    BACKEND_ROOT = REPO.parent
+else:
+    BACKEND_ROOT = Path(tempfile.mkdtemp(prefix="backend-"))
+    (BACKEND_ROOT / "backend").symlink_to(REPO, target_is_directory=True)
+sys.path.insert(0, str(BACKEND_ROOT))
+
+# Settings are read at import time.
+os.environ.setdefault("JWT_SECRET", "test")
+os.environ.setdefault("JWT_ACCESS_EXPIRES", "600")
+
+
+@pytest.fixture
+def backend_root() -> Path:
+    """Directory to put on PYTHONPATH to import ``backend``."""
+    return BACKEND_ROOT
@@ -0,0 +1,46 @@
+"""
+Cold start budget: ``import backend.main`` in a fresh interpreter has to
+stay under COLD_START_BUDGET_MS (1500 by default). For the per-module
+breakdown, run ``python -m backend.benchmarks.startup``.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", 1500))
+MEASURE = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import backend.main\n"
+    "print((time.perf_counter() - start) * 1000)\n"
+)
+
+
+def _import_ms(root: Path) -> float:
+    env = {
+        "JWT_SECRET": "cold-start",
+        "JWT_ACCESS_EXPIRES": "600",
+        **os.environ,
+        "PYTHONPATH": str(root),
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_backend_main_within_budget(backend_root):
+    # The first run also writes the bytecode caches a deployed service has.
+    _import_ms(backend_root)
+    import_ms = _import_ms(backend_root)
+    assert import_ms < BUDGET_MS, (
+        f"import backend.main took {import_ms:.0f} ms, budget {BUDGET_MS:.0f} ms; "
+        "see python -m backend.benchmarks.startup for the slowest imports"
+    )
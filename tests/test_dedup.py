@@ -0,0 +1,153 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import backend.utils.bloom as bloom
+from backend.api.analytic import analytic_service
+from backend.api.analytic.dedup import EventDeduplicator
+from backend.utils.bloom import BloomFilter, RotatingBloomFilter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom_filter = BloomFilter(10_000, 0.01)
+    items = [f"key-{i}" for i in range(10_000)]
+    for item in items:
+        bloom_filter.add(item)
+    assert all(bloom_filter.might_contain(item) for item in items)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom_filter = BloomFilter(10_000, 0.01)
+    for i in range(10_000):
+        bloom_filter.add(f"key-{i}")
+    positives = sum(bloom_filter.might_contain(f"other-{i}") for i in range(20_000))
+    assert positives / 20_000 < 0.02
+
+
+def test_rotation_keeps_items_for_a_full_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bloom.time, "monotonic", clock)
+    rotating = RotatingBloomFilter(60, 1000, 0.01)
+    rotating.add("early")
+    clock.now += 59
+    rotating.add("late")
+    clock.now += 1
+    # Rotated once: both generations are still checked.
+    assert rotating.might_contain("early")
+    assert rotating.might_contain("late")
+    clock.now += 59
+    assert rotating.might_contain("late")
+    clock.now += 1
+    # Rotated twice since they were added: forgotten.
+    assert not rotating.might_contain("early")
+    assert not rotating.might_contain("late")
+
+
+class Collection:
+    def __init__(self, docs=(), duplicate=False):
+        self.docs = list(docs)
+        self.duplicate = duplicate
+
+    async def find_one(self, query, projection=None):
+        return next((doc for doc in self.docs if doc.get("k") == query["k"]), None)
+
+    def with_options(self, **options):
+        return self
+
+    async def insert_one(self, doc):
+        if self.duplicate:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.docs.append(doc)
+
+
+class Partitions:
+    def __init__(self, *collections):
+        self.collections = list(collections)
+
+    async def collections_for_range(self, db, start, end):
+        return self.collections
+
+
+def test_bloom_miss_accepts_without_lookup():
+    dedup = EventDeduplicator(3600, 1000, 0.01)
+    partitions = Partitions()
+    assert not asyncio.run(dedup.is_duplicate("k1", partitions, None))
+    assert dedup.stats()["accepted"] == 1
+
+
+def test_repeat_is_confirmed_in_any_partition_of_the_window():
+    dedup = EventDeduplicator(3600, 1000, 0.01)
+    # The original was stored in the previous month's partition.
+    partitions = Partitions(Collection(), Collection([{"k": "k1"}]))
+    assert not asyncio.run(dedup.is_duplicate("k1", partitions, None))
+    assert asyncio.run(dedup.is_duplicate("k1", partitions, None))
+    assert dedup.stats()["duplicates"] == 1
+
+
+def test_bloom_hit_without_stored_event_is_a_false_positive():
+    dedup = EventDeduplicator(3600, 1000, 0.01)
+    partitions = Partitions(Collection())
+    asyncio.run(dedup.is_duplicate("k1", partitions, None))
+    # The first event never got stored (e.g. the insert failed).
+    assert not asyncio.run(dedup.is_duplicate("k1", partitions, None))
+    assert dedup.stats()["false_positives"] == 1
+
+
+def test_unique_index_duplicate_skips_ingest_side_effects(monkeypatch):
+    collection = Collection(duplicate=True)
+    calls = []
+
+    async def encode(db, data):
+        return {"t": datetime.now(timezone.utc), "n": 1, "c": 1, "src": 0, "u": "u1", "k": "sub:k1"}
+
+    async def ensure(db, moment):
+        return collection
+
+    async def record(db, doc):
+        calls.append("record")
+
+    dedup = EventDeduplicator(3600, 1000, 0.01)
+    monkeypatch.setattr(analytic_service.event_codec, "encode", encode)
+    monkeypatch.setattr(analytic_service.event_partitions, "ensure", ensure)
+    monkeypatch.setattr(analytic_service, "event_deduplicator", dedup)
+    monkeypatch.setattr(analytic_service.ingest_watermark, "advance", lambda: calls.append("advance"))
+    monkeypatch.setattr(analytic_service.hot_window, "append", lambda doc: calls.append("append"))
+    monkeypatch.setattr(analytic_service.activity_bitmaps, "record", record)
+    monkeypatch.setattr(analytic_service.session_aggregator, "record", record)
+    monkeypatch.setattr(analytic_service.topk_sketches, "record", lambda doc: calls.append("topk"))
+    monkeypatch.setattr(analytic_service.live_counters, "record", lambda name: calls.append("live"))
+
+    result = asyncio.run(analytic_service.AnalyticsService.create_event({"event_name": "x"}, None))
+    assert result == {"event_id": None, "duplicate": True}
+    assert dedup.stats()["index_duplicates"] == 1
+    assert calls == []
+
+
+@pytest.mark.parametrize("w", ["0", "1", "majority"])
+def test_keyed_events_are_acknowledged_under_any_write_concern(monkeypatch, w):
+    collection = Collection(duplicate=True)
+    write_concerns = []
+    collection.with_options = lambda write_concern: write_concerns.append(write_concern) or collection
+
+    async def encode(db, data):
+        return {"t": datetime.now(timezone.utc), "n": 1, "c": 1, "src": 0, "k": "sub:k1"}
+
+    async def ensure(db, moment):
+        return collection
+
+    monkeypatch.setattr(analytic_service.settings, "INGEST_WRITE_CONCERN", w)
+    monkeypatch.setattr(analytic_service.event_codec, "encode", encode)
+    monkeypatch.setattr(analytic_service.event_partitions, "ensure", ensure)
+    monkeypatch.setattr(analytic_service, "event_deduplicator", EventDeduplicator(3600, 1000, 0.01))
+    asyncio.run(analytic_service.AnalyticsService.create_event({"event_name": "x"}, None))
+    assert write_concerns[0].acknowledged
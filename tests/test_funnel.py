@@ -0,0 +1,118 @@
+import asyncio
+import random
+
+from backend.api.analytic.funnel import FunnelMatcher, merge_user_streams
+
+SIGNUP, VIEW, BUY = 1, 2, 3
+
+
+async def _cursor(docs):
+    for doc in docs:
+        yield doc
+
+
+def _merge(*partitions):
+    async def collect():
+        return [doc async for doc in merge_user_streams([_cursor(docs) for docs in partitions])]
+    return asyncio.run(collect())
+
+
+def _sorted(docs):
+    # The order of the funnel cursors: u descending, then t ascending.
+    return sorted(sorted(docs, key=lambda doc: doc["t"]), key=lambda doc: doc["u"], reverse=True)
+
+
+def _run(events, steps=(SIGNUP, VIEW, BUY), window=100):
+    matcher = FunnelMatcher(list(steps), window)
+    for user, at, code in events:
+        matcher.feed(user, at, code)
+    return matcher.result([f"s{i}" for i in range(len(steps))])
+
+
+def _users(result):
+    return [step["users"] for step in result["steps"]]
+
+
+def test_merge_interleaves_partitions():
+    older = [{"u": "b", "t": 1}, {"u": "a", "t": 2}, {"u": "a", "t": 5}]
+    newer = [{"u": "c", "t": 9}, {"u": "b", "t": 7}, {"u": "a", "t": 3}]
+    merged = _merge(older, newer)
+    assert [(doc["u"], doc["t"]) for doc in merged] == [
+        ("c", 9), ("b", 1), ("b", 7), ("a", 2), ("a", 3), ("a", 5)
+    ]
+
+
+def test_merge_handles_empty_and_single_cursors():
+    assert _merge() == []
+    assert _merge([], [{"u": "a", "t": 1}], []) == [{"u": "a", "t": 1}]
+
+
+def test_merge_matches_a_global_sort():
+    rng = random.Random(7)
+    docs = [{"u": f"u{rng.randrange(20)}", "t": rng.randrange(1000), "i": i} for i in range(500)]
+    partitions = [_sorted(docs[i::4]) for i in range(4)]
+    merged = _merge(*partitions)
+    assert [(doc["u"], doc["t"]) for doc in merged] == [(doc["u"], doc["t"]) for doc in _sorted(docs)]
+
+
+def test_funnel_over_merged_partitions():
+    # u1's signup is in the older partition and the rest in the newer one.
+    older = [{"u": "u1", "t": 10, "n": SIGNUP}]
+    newer = [{"u": "u2", "t": 5, "n": SIGNUP}, {"u": "u1", "t": 20, "n": VIEW}, {"u": "u1", "t": 30, "n": BUY}]
+    events = [(doc["u"], doc["t"], doc["n"]) for doc in _merge(_sorted(older), _sorted(newer))]
+    result = _run(events)
+    assert _users(result) == [2, 1, 1]
+    assert result["steps"][2]["median_seconds_to_convert"] == 20
+
+
+def test_steps_out_of_order_do_not_convert():
+    assert _users(_run([("u1", 1, BUY), ("u1", 2, VIEW), ("u1", 3, SIGNUP)])) == [1, 0, 0]
+
+
+def test_window_edges():
+    # Exactly window seconds after the start still converts; one more does not.
+    assert _users(_run([("u1", 0, SIGNUP), ("u1", 50, VIEW), ("u1", 100, BUY)])) == [1, 1, 1]
+    assert _users(_run([("u1", 0, SIGNUP), ("u1", 50, VIEW), ("u1", 101, BUY)])) == [1, 1, 0]
+    assert _users(_run([("u1", 0, SIGNUP), ("u1", 101, VIEW)])) == [1, 0, 0]
+
+
+def test_later_start_keeps_the_window_open():
+    # The second signup restarts the chain, so the purchase at 150 is within
+    # 100 seconds of a chain start.
+    events = [("u1", 0, SIGNUP), ("u1", 60, SIGNUP), ("u1", 70, VIEW), ("u1", 150, BUY)]
+    result = _run(events)
+    assert _users(result) == [1, 1, 1]
+    assert result["steps"][2]["median_seconds_to_convert"] == 90
+
+
+def test_repeated_step_codes_advance_one_step_per_event():
+    # Funnel view -> view -> buy: one view event must not count for both steps.
+    steps = (VIEW, VIEW, BUY)
+    assert _users(_run([("u1", 0, VIEW), ("u1", 10, BUY)], steps)) == [1, 0, 0]
+    assert _users(_run([("u1", 0, VIEW), ("u1", 5, VIEW), ("u1", 10, BUY)], steps)) == [1, 1, 1]
+
+
+def test_repeated_events_count_a_user_once():
+    events = [("u1", t, code) for t in range(0, 40, 10) for code in (SIGNUP, VIEW)]
+    result = _run(events)
+    assert _users(result) == [1, 1, 0]
+    assert result["users_entered"] == 1
+    assert result["steps"][1]["conversion_rate"] == 1.0
+
+
+def test_users_are_counted_independently():
+    events = [
+        ("u3", 0, SIGNUP), ("u3", 1, VIEW), ("u3", 2, BUY),
+        ("u2", 0, SIGNUP), ("u2", 1, VIEW),
+        ("u1", 0, VIEW), ("u1", 1, BUY),
+    ]
+    result = _run(events)
+    assert _users(result) == [2, 2, 1]
+    assert [step["conversion_rate"] for step in result["steps"]] == [1.0, 1.0, 0.5]
+
+
+def test_empty_funnel():
+    result = _run([])
+    assert result["users_entered"] == 0
+    assert [step["conversion_rate"] for step in result["steps"]] == [0.0, 0.0, 0.0]
+    assert result["steps"][1]["median_seconds_to_convert"] is None
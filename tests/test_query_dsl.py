@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from backend.api.analytic.query_dsl import compile_match, storage_key
+from backend.api.analytic.schemas.request import QueryFilter
+
+CODES = {("event_name", "signup"): 1, ("event_name", "login"): 2, ("source", "web"): 0}
+
+
+async def _lookup(db, field, value):
+    return CODES.get((field, value))
+
+
+def _compile(*filters, metadata_keys=frozenset({"plan"})):
+    clauses = [QueryFilter(**f) for f in filters]
+    return asyncio.run(compile_match(clauses, set(metadata_keys), _lookup, None))
+
+
+def test_encoded_field_is_looked_up():
+    match, used = _compile({"field": "event_name", "value": "signup"})
+    assert match == {"n": {"$eq": 1}}
+    assert used == set()
+
+
+def test_unknown_encoded_value_uses_the_sentinel():
+    match, _ = _compile({"field": "event_name", "op": "ne", "value": "never-stored"})
+    assert match == {"n": {"$ne": -1}}
+
+
+def test_in_and_nin_drop_unknown_values():
+    match, _ = _compile(
+        {"field": "event_name", "op": "in", "value": ["signup", "nope", "login"]},
+        {"field": "source", "op": "nin", "value": ["nope"]},
+    )
+    assert match == {"n": {"$in": [1, 2]}, "src": {"$nin": []}}
+
+
+def test_exists_is_not_looked_up():
+    match, _ = _compile({"field": "event_name", "op": "exists", "value": 1})
+    assert match == {"n": {"$exists": True}}
+
+
+def test_plain_and_metadata_fields():
+    match, used = _compile(
+        {"field": "user_id", "value": "u1"},
+        {"field": "metadata.plan", "op": "gte", "value": 3},
+        {"field": "metadata.plan", "op": "lt", "value": 9},
+    )
+    assert match == {"u": {"$eq": "u1"}, "m.plan": {"$gte": 3, "$lt": 9}}
+    assert used == {"plan"}
+
+
+def test_ordering_operator_on_encoded_field_is_rejected():
+    with pytest.raises(ValueError, match="only eq, ne, in, nin and exists"):
+        _compile({"field": "event_name", "op": "gt", "value": "a"})
+
+
+@pytest.mark.parametrize("clause", [
+    {"field": "user_id", "value": {"$ne": None}},
+    {"field": "user_id", "value": ["a"]},
+    {"field": "user_id", "op": "in", "value": "a"},
+    {"field": "user_id", "op": "in", "value": [{"$gt": ""}]},
+])
+def test_non_scalar_values_are_rejected(clause):
+    with pytest.raises(ValueError):
+        _compile(clause)
+
+
+@pytest.mark.parametrize("field", ["created_at", "t", "m.plan", "metadata.secret", "$where"])
+def test_fields_outside_the_whitelist_are_rejected(field):
+    with pytest.raises(ValueError):
+        storage_key(field, {"plan"})
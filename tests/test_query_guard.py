@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend.utils.query_guard import AggregationLimiter, QueryGuard, _remaining_ms
+
+
+class Request:
+    async def receive(self):
+        await asyncio.Event().wait()
+
+
+async def _remaining_after_wait(guard: QueryGuard, wait: float) -> int:
+    await guard.limiter.acquire(timeout=1)
+    asyncio.get_running_loop().call_later(wait, guard.limiter.release)
+    dependency = guard(Request(), db=None)
+    await anext(dependency)
+    try:
+        return _remaining_ms()
+    finally:
+        await dependency.aclose()
+
+
+def test_slot_wait_is_taken_from_the_budget():
+    guard = QueryGuard(500, AggregationLimiter(1, 1))
+    remaining = asyncio.run(_remaining_after_wait(guard, 0.3))
+    assert remaining <= 200
+    assert guard.limiter.active == 0
+
+
+def test_slot_wait_cannot_outlast_the_budget():
+    guard = QueryGuard(100, AggregationLimiter(1, 1))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_remaining_after_wait(guard, 0.3))
+    assert error.value.status_code == 503
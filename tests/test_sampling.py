@@ -0,0 +1,115 @@
+import asyncio
+import math
+
+import pytest
+
+import backend.api.analytic.sampling as sampling
+from backend.api.analytic.sampling import (
+    SAMPLE_BUCKETS, SAMPLE_INDEX, SampleCoverage, estimate, exact, sample_buckets, sample_filter
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Collection:
+    def __init__(self, name, indexed=True, backfilled=True):
+        self.name = name
+        self.indexed = indexed
+        self.backfilled = backfilled
+        self.checks = 0
+
+    async def index_information(self):
+        self.checks += 1
+        return {"_id_": {}, SAMPLE_INDEX: {}} if self.indexed else {"_id_": {}}
+
+    async def find_one(self, query, projection=None, hint=None):
+        assert query == {"h": {"$exists": False}}
+        assert hint == SAMPLE_INDEX
+        return None if self.backfilled else {"_id": 1}
+
+
+def _split(coverage, collections):
+    sampled, unsampled = asyncio.run(coverage.split(collections))
+    return [c.name for c in sampled], [c.name for c in unsampled]
+
+
+@pytest.mark.parametrize("rate, buckets", [(0.1, 1000), (0.00001, 1), (0, 1), (1, SAMPLE_BUCKETS), (2, SAMPLE_BUCKETS)])
+def test_sample_buckets_are_clamped(rate, buckets):
+    assert sample_buckets(rate) == buckets
+    assert sample_filter(rate) == {"h": {"$lt": buckets}}
+
+
+def test_estimate_scales_by_the_rate():
+    assert estimate(250, 0.25)["count"] == 1000
+    assert estimate(7, 1) == {"count": 7, "ci95": [7, 7]}
+
+
+def test_estimate_interval():
+    result = estimate(100, 0.1)
+    margin = 1.96 * math.sqrt(100 * 0.9) / 0.1
+    assert result["count"] == 1000
+    assert result["ci95"] == [math.floor(1000 - margin), math.ceil(1000 + margin)]
+
+
+def test_estimate_interval_is_clamped_at_zero():
+    low, high = estimate(1, 0.01)["ci95"]
+    assert low == 0
+    assert high > 100
+
+
+def test_estimate_of_an_empty_sample_uses_the_rule_of_three():
+    assert estimate(0, 0.1) == {"count": 0, "ci95": [0, 30]}
+    assert estimate(0, 0.1, exact=5) == {"count": 5, "ci95": [5, 35]}
+
+
+def test_exact_counts_are_added_unscaled():
+    sampled = estimate(100, 0.1)
+    combined = estimate(100, 0.1, exact=42)
+    assert combined["count"] == sampled["count"] + 42
+    assert combined["ci95"] == [bound + 42 for bound in sampled["ci95"]]
+
+
+def test_exact():
+    assert exact(12) == {"count": 12, "ci95": [12, 12]}
+
+
+def test_split_by_index_and_backfill():
+    coverage = SampleCoverage()
+    collections = [
+        Collection("event_202601"),
+        Collection("event_202512", indexed=False),
+        Collection("event_202511", backfilled=False),
+    ]
+    assert _split(coverage, collections) == (["event_202601"], ["event_202512", "event_202511"])
+
+
+def test_ready_partitions_are_not_checked_again():
+    coverage = SampleCoverage()
+    collection = Collection("event_202601")
+    _split(coverage, [collection])
+    _split(coverage, [collection])
+    assert collection.checks == 1
+
+
+def test_unready_partitions_are_rechecked_after_the_interval(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sampling.time, "monotonic", clock)
+    coverage = SampleCoverage(recheck_seconds=300)
+    collection = Collection("event_202512", backfilled=False)
+    assert _split(coverage, [collection]) == ([], ["event_202512"])
+
+    # Backfilled in the meantime, but not looked at again until the interval passes.
+    collection.backfilled = True
+    clock.now += 299
+    assert _split(coverage, [collection]) == ([], ["event_202512"])
+    assert collection.checks == 1
+
+    clock.now += 1
+    assert _split(coverage, [collection]) == (["event_202512"], [])
+    assert collection.checks == 2
@@ -0,0 +1,124 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.api.analytic.topk import SpaceSaving, TopKSketches, merge_summaries
+
+
+def _stream(seed: int, size: int) -> list[str]:
+    rng = random.Random(seed)
+    # Zipf-like: a few heavy keys and a long tail.
+    return [f"k{min(int(rng.paretovariate(1.2)), 500)}" for _ in range(size)]
+
+
+def test_exact_below_capacity():
+    summary = SpaceSaving(10)
+    for key in "aababcabcd":
+        summary.add(key)
+    assert summary.counters == {"a": [4, 0], "b": [3, 0], "c": [2, 0], "d": [1, 0]}
+    assert summary.min_count == 0
+
+
+def test_weighted_add():
+    summary = SpaceSaving(2)
+    summary.add("a", 5)
+    summary.add("b", 2)
+    summary.add("c", 3)
+    # c replaces b (count 2) and inherits it as error.
+    assert summary.counters == {"a": [5, 0], "c": [5, 2]}
+
+
+def test_eviction_replaces_the_smallest_counter():
+    summary = SpaceSaving(2)
+    for key in ["a", "a", "a", "b", "c"]:
+        summary.add(key)
+    assert summary.counters == {"a": [3, 0], "c": [2, 1]}
+    assert summary.full
+    assert summary.min_count == 2
+
+
+def test_error_bounds_hold():
+    stream = _stream(1, 20_000)
+    truth = Counter(stream)
+    summary = SpaceSaving(50)
+    for key in stream:
+        summary.add(key)
+    assert sum(count for count, _ in summary.counters.values()) == len(stream)
+    for key, (count, error) in summary.counters.items():
+        assert count - error <= truth[key] <= count
+    for key, true_count in truth.items():
+        if key not in summary.counters:
+            assert true_count <= summary.min_count
+    # Every key above N / capacity is tracked.
+    for key, true_count in truth.items():
+        if true_count > len(stream) / 50:
+            assert key in summary.counters
+
+
+def test_document_round_trip():
+    summary = SpaceSaving(2)
+    for key in ["a", "a", "b", "c"]:
+        summary.add(key)
+    doc = summary.to_document()
+    assert doc["cap"] == 2
+    assert doc["min"] == summary.min_count
+    assert sorted(doc["counters"]) == sorted([key, count, error] for key, (count, error) in summary.counters.items())
+
+
+def test_merge_without_eviction_is_exact():
+    docs = []
+    for keys in (["a", "a", "b"], ["a", "c"]):
+        summary = SpaceSaving(10)
+        for key in keys:
+            summary.add(key)
+        docs.append(summary.to_document())
+    assert merge_summaries(docs, 2) == [
+        {"key": "a", "count": 3, "lower": 3, "error": 0},
+        {"key": "b", "count": 1, "lower": 1, "error": 0},
+    ]
+
+
+def test_merge_adds_min_count_for_keys_missing_from_a_full_summary():
+    full = {"cap": 2, "min": 4, "counters": [["a", 9, 0], ["b", 4, 1]]}
+    partial = {"cap": 10, "min": 0, "counters": [["c", 2, 0], ["a", 1, 0]]}
+    results = {r["key"]: r for r in merge_summaries([full, partial], 3)}
+    assert results["a"] == {"key": "a", "count": 10, "lower": 10, "error": 0}
+    assert results["b"] == {"key": "b", "count": 4, "lower": 3, "error": 1}
+    # c may have occurred up to 4 times in the full summary.
+    assert results["c"] == {"key": "c", "count": 6, "lower": 2, "error": 4}
+
+
+def test_merged_bounds_hold_across_summaries():
+    streams = [_stream(seed, 5_000) for seed in range(4)]
+    truth = Counter(key for stream in streams for key in stream)
+    docs = []
+    for stream in streams:
+        summary = SpaceSaving(30)
+        for key in stream:
+            summary.add(key)
+        docs.append(summary.to_document())
+    results = merge_summaries(docs, 10)
+    assert len(results) == 10
+    assert [r["count"] for r in results] == sorted((r["count"] for r in results), reverse=True)
+    for r in results:
+        assert r["lower"] <= truth[r["key"]] <= r["count"]
+        assert r["error"] == r["count"] - r["lower"]
+
+
+def test_failed_flush_keeps_buckets_dirty():
+    class FailingCollection:
+        async def bulk_write(self, operations, ordered=True):
+            raise RuntimeError("write failed")
+
+    class FakeDb:
+        topk = FailingCollection()
+
+    sketches = TopKSketches(10)
+    sketches.record({"t": datetime.now(timezone.utc), "n": 1, "c": 2, "src": 0, "u": "u1"})
+    dirty = set(sketches._dirty)
+    with pytest.raises(RuntimeError):
+        asyncio.run(sketches.flush(FakeDb()))
+    assert sketches._dirty == dirty
@@ -1,9 +1,13 @@
-import aiohttp
+from __future__ import annotations
+
 import asyncio
 import logging
-from typing import Optional, Any, Dict
+from typing import TYPE_CHECKING, Optional, Any, Dict
 import time
 
+if TYPE_CHECKING:
+    import aiohttp
+
 log = logging.getLogger("analytics.http")
 
 
@@ -41,6 +45,10 @@ class AioHttpClientSession:
                 log.debug("aiohttp session already initialized")
                 return
 
+            # Imported on first use: only third-party metric fetches need it,
+            # and it is one of the slowest imports of the service.
+            import aiohttp
+
             timeout = aiohttp.ClientTimeout(
                 total=HttpClientConfig.TIMEOUT_TOTAL,
                 connect=HttpClientConfig.TIMEOUT_CONNECT,
@@ -1,8 +1,7 @@
-from http.client import HTTPException
 from time import time
 from typing import Any, Dict, Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi import Request, status
+from fastapi import HTTPException, Request, status
 import jwt
 from backend.utils.settings import Settings
 
@@ -49,6 +48,11 @@ class JWTBearer(HTTPBearer):
         self.fetch_user = fetch_user
 
     async def __call__(self, request: Request) -> Dict[str, Any]:
+        # Several dependencies of one request may authenticate it (e.g. the
+        # endpoint and its rate limit); the token is only decoded once.
+        cached = getattr(request.state, "jwt_payload", None)
+        if cached is not None:
+            return cached
         credentials: Optional[HTTPAuthorizationCredentials] = await super().__call__(request)
         if credentials is None or credentials.scheme != "Bearer":
             raise HTTPException(
@@ -58,6 +62,7 @@ class JWTBearer(HTTPBearer):
             )
 
         payload = decode_jwt(credentials.credentials)
+        request.state.jwt_payload = payload
         if self.fetch_user:
             return payload
         return payload
@@ -0,0 +1,68 @@
+import math
+import time
+from hashlib import blake2b
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings. ``might_contain`` has no false
+    negatives and a false positive rate of about ``error_rate`` once
+    ``capacity`` items were added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: k positions derived from two 64-bit halves of one digest.
+        digest = blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RotatingBloomFilter:
+    """
+    Bloom filter over a sliding time window: two generations are kept and
+    the older one is discarded every ``window_seconds``, so an item is
+    remembered for at least one full window.
+    """
+
+    def __init__(self, window_seconds: float, capacity: int, error_rate: float):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous: BloomFilter | None = None
+        self.rotated_at = time.monotonic()
+
+    def _rotate(self) -> None:
+        now = time.monotonic()
+        if now - self.rotated_at >= self.window_seconds:
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.rotated_at = now
+
+    def add(self, item: str) -> None:
+        self._rotate()
+        self.current.add(item)
+
+    def might_contain(self, item: str) -> bool:
+        self._rotate()
+        if self.current.might_contain(item):
+            return True
+        return self.previous is not None and self.previous.might_contain(item)
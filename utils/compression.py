@@ -0,0 +1,173 @@
+import asyncio
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency, br is not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, zstd is not offered
+    zstandard = None
+
+
+class _Gzip:
+    def __init__(self):
+        self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+# Encoding -> compressor factory, in server preference order.
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _Zstd
+if brotli is not None:
+    ENCODERS["br"] = _Brotli
+ENCODERS["gzip"] = _Gzip
+
+# Streams must reach the client as they are produced.
+UNCOMPRESSED_TYPES = (b"text/event-stream",)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """Pick the best available encoding accepted by the client (q > 0)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in ENCODERS:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least ``minimum_size`` bytes with the
+    best encoding the client accepts (zstd, br, gzip). Chunks of
+    ``offload_size`` bytes or more are compressed in a worker thread so the
+    event loop keeps serving requests. Event streams pass through.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, offload_size: int = 256 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        compressor = None
+        buffered: list[bytes] = []
+        size = 0
+
+        async def compress(data: bytes) -> bytes:
+            if len(data) >= self.offload_size:
+                return await asyncio.to_thread(compressor.compress, data)
+            return compressor.compress(data)
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough, compressor, size
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                response_headers = dict(message.get("headers", []))
+                content_type = response_headers.get(b"content-type", b"")
+                if b"content-encoding" in response_headers or content_type.startswith(UNCOMPRESSED_TYPES):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                # Buffer until the response is known to be worth compressing.
+                buffered.append(body)
+                size += len(body)
+                if size < self.minimum_size:
+                    if more_body:
+                        return
+                    passthrough = True
+                    await send(start)
+                    await send({"type": "http.response.body", "body": b"".join(buffered)})
+                    return
+                compressor = ENCODERS[encoding]()
+                response_headers = []
+                for name, value in start.get("headers", []):
+                    if name == b"content-length":
+                        continue
+                    if name == b"etag" and not value.startswith(b"W/"):
+                        # The bytes differ per encoding, so only a weak validator holds.
+                        value = b"W/" + value
+                    response_headers.append((name, value))
+                response_headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"vary", b"Accept-Encoding"),
+                ]
+                body = b"".join(buffered)
+                buffered.clear()
+                if not more_body:
+                    data = await compress(body) + compressor.finish()
+                    response_headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start, "headers": response_headers})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start, "headers": response_headers})
+
+            data = await compress(body)
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,101 @@
+"""
+Runs ``explain`` on every query shape issued by ``AnalyticsService`` against
+the current event partition and reports collection scans and how many
+keys/documents each query examines per returned document.
+
+    python -m backend.utils.index_advisor
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from backend.api.analytic.analytic_service import AnalyticsService
+from backend.api.analytic.partitions import partition_name
+from backend.utils.mongodb import connect_to_mongo, close_mongo, get_db
+
+log = logging.getLogger("analytic_server.db")
+
+
+def _find_key(node, key: str):
+    """
+    Depth-first search for ``key`` in an explain document. The layout of
+    explain output differs between find/aggregate and query engines.
+    """
+    if isinstance(node, dict):
+        if key in node:
+            return node[key]
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan) -> list[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key in ("inputStage", "queryPlan"):
+            stages.extend(_plan_stages(plan.get(key)))
+        for child in plan.get("inputStages", []):
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+def summarize(name: str, explain: dict) -> dict:
+    stats = _find_key(explain, "executionStats") or {}
+    winning_plan = _find_key(explain, "winningPlan") or {}
+    stages = _plan_stages(winning_plan)
+    returned = stats.get("nReturned", 0)
+    keys = stats.get("totalKeysExamined", 0)
+    docs = stats.get("totalDocsExamined", 0)
+    return {
+        "query": name,
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "n_returned": returned,
+        "keys_examined": keys,
+        "docs_examined": docs,
+        "keys_per_returned": round(keys / max(returned, 1), 2),
+        "docs_per_returned": round(docs / max(returned, 1), 2),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+async def advise(db) -> list[dict]:
+    collection = partition_name(datetime.now(timezone.utc))
+    sample = await db[collection].find_one({"u": {"$gt": ""}}, {"n": 1, "u": 1}) or {}
+    shapes = AnalyticsService.query_shapes(
+        collection,
+        sample.get("n", 0),
+        sample.get("u", "sample-user")
+    )
+    report = []
+    for name, command in shapes.items():
+        explain = await db.command({"explain": command, "verbosity": "executionStats"})
+        report.append(summarize(name, explain))
+    return report
+
+
+async def main() -> None:
+    await connect_to_mongo()
+    try:
+        report = await advise(get_db())
+    finally:
+        await close_mongo()
+    for row in report:
+        flag = "COLLSCAN" if row["collscan"] else "ok"
+        print(f"{row['query']:<40} {flag:<9} "
+              f"keys/ret={row['keys_per_returned']:<8} docs/ret={row['docs_per_returned']:<8} "
+              f"stages={'>'.join(row['stages'])}")
+    print(json.dumps(report, default=str))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,10 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from backend.utils.settings import get_settings
 import logging
 from typing import Optional
+from pymongo import IndexModel, ReturnDocument, uri_parser
+from pymongo.write_concern import WriteConcern
 from fastapi import status, HTTPException
 
 log = logging.getLogger("analytic_server.db")
@@ -9,6 +12,28 @@ settings = get_settings()
 
 _client: Optional[AsyncIOMotorClient] = None
 _db: Optional[AsyncIOMotorDatabase] = None
+# Analytics reads: own pool, secondaryPreferred by default.
+_read_client: Optional[AsyncIOMotorClient] = None
+_read_db: Optional[AsyncIOMotorDatabase] = None
+# Direct connections to single servers, keyed by (host, port).
+_member_clients: dict[tuple[str, int], AsyncIOMotorClient] = {}
+# URI options that describe the whole deployment, not one server.
+_DEPLOYMENT_OPTIONS = {
+    "replicaset", "readpreference", "readpreferencetags", "maxstalenessseconds", "directconnection"
+}
+
+
+def _read_options() -> dict:
+    options = {"readPreference": settings.MONGO_READ_PREFERENCE}
+    # maxStalenessSeconds is not allowed with primary reads.
+    if settings.MONGO_READ_PREFERENCE != "primary" and settings.MONGO_MAX_STALENESS_SECONDS > 0:
+        options["maxStalenessSeconds"] = settings.MONGO_MAX_STALENESS_SECONDS
+    return options
+
+
+def ingest_write_concern() -> WriteConcern:
+    w = settings.INGEST_WRITE_CONCERN
+    return WriteConcern(w=int(w) if w.isdigit() else w)
 
 
 async def connect_to_mongo() -> None:
@@ -16,7 +41,7 @@ async def connect_to_mongo() -> None:
     Initialize MongoDB connection and store client & database globally.
     Raises RuntimeError if connection fails.
     """
-    global _client, _db
+    global _client, _db, _read_client, _read_db
     if _client is not None and _db is not None:
         log.info("MongoDB connection already exists")
         return
@@ -25,14 +50,26 @@ async def connect_to_mongo() -> None:
         log.info("Connecting to MongoDB...")
         _client = AsyncIOMotorClient(
             settings.MONGO_URI,
-            maxPoolSize=50,
-            minPoolSize=5,
+            maxPoolSize=settings.MONGO_WRITE_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
             serverSelectionTimeoutMS=5000,  # 5 seconds
             tz_aware=True
         )
         _db = _client[settings.DB_NAME]
-        await _db.command("ping")
-        log.info("MongoDB CONNECTED", extra={"db": settings.DB_NAME})
+        _read_client = AsyncIOMotorClient(
+            settings.MONGO_READ_URI or settings.MONGO_URI,
+            maxPoolSize=settings.MONGO_READ_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=5000,
+            tz_aware=True,
+            **_read_options()
+        )
+        _read_db = _read_client[settings.DB_NAME]
+        await asyncio.gather(_db.command("ping"), _read_db.command("ping"))
+        log.info("MongoDB CONNECTED", extra={
+            "db": settings.DB_NAME,
+            "read_preference": settings.MONGO_READ_PREFERENCE
+        })
     except Exception as e:
         log.exception("Failed to connect to MongoDB")
         raise RuntimeError(f"Cannot connect to MongoDB: {e}")
@@ -42,13 +79,108 @@ async def close_mongo() -> None:
     """
     Gracefully close the MongoDB client.
     """
-    global _client
+    global _client, _db, _read_client, _read_db
     if _client:
         log.info("Closing MongoDB connection")
         _client.close()
         _client = None
+        _db = None
     else:
         log.info("MongoDB client already closed")
+    if _read_client:
+        _read_client.close()
+        _read_client = None
+        _read_db = None
+    for client in _member_clients.values():
+        client.close()
+    _member_clients.clear()
+
+
+def member_client(address: tuple[str, int]) -> AsyncIOMotorClient:
+    """
+    Client connected directly to one server of the deployment, with the
+    credentials and TLS options of the read URI. For commands that have to
+    run on a given server, such as $currentOp followed by killOp.
+    """
+    client = _member_clients.get(address)
+    if client is None:
+        parsed = uri_parser.parse_uri(settings.MONGO_READ_URI or settings.MONGO_URI)
+        options = {
+            name: value for name, value in parsed["options"].items()
+            if name.lower() not in _DEPLOYMENT_OPTIONS
+        }
+        client = AsyncIOMotorClient(
+            host=address[0],
+            port=address[1],
+            username=parsed["username"],
+            password=parsed["password"],
+            directConnection=True,
+            serverSelectionTimeoutMS=5000,
+            **options
+        )
+        _member_clients[address] = client
+    return client
+
+
+async def warm_up_pool() -> None:
+    """
+    Open the minimum pool connections up front so the first requests
+    do not pay for the TCP/auth handshake.
+    """
+    if _db is None:
+        return
+    await asyncio.gather(*(
+        db.command("ping")
+        for db in (_db, _read_db) if db is not None
+        for _ in range(settings.MONGO_MIN_POOL_SIZE)
+    ))
+
+
+async def ping() -> bool:
+    if _db is None:
+        return False
+    try:
+        await asyncio.wait_for(_db.command("ping"), timeout=1)
+        return True
+    except Exception:
+        return False
+
+
+async def ensure_collection_indexes(
+    collection,
+    indexes: list[IndexModel],
+    redundant: list[str] | None = None
+) -> list[str]:
+    """
+    Create the missing indexes of a collection in a single createIndexes call
+    and drop the redundant ones that are still present.
+    Returns the names of the indexes that were created.
+    """
+    existing = await collection.index_information()
+    for name in redundant or []:
+        if name in existing:
+            await collection.drop_index(name)
+            log.info("Dropped redundant index", extra={
+                "collection": collection.name,
+                "index": name
+            })
+    missing = [index for index in indexes if index.document["name"] not in existing]
+    if not missing:
+        return []
+    return await collection.create_indexes(missing)
+
+
+async def next_sequence(db, name: str) -> int:
+    """
+    Atomically increment and return the named counter in ``counters``.
+    """
+    counter = await db.counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
 
 
 def get_db() -> AsyncIOMotorDatabase:
@@ -58,3 +190,13 @@ def get_db() -> AsyncIOMotorDatabase:
             detail="Database not initialized"
         )
     return _db
+
+
+def get_read_db() -> AsyncIOMotorDatabase:
+    """
+    Database handle for analytics reads (separate pool, read preference
+    from Settings). Writes issued through it still go to the primary.
+    """
+    if _read_db is None:
+        return get_db()
+    return _read_db
@@ -1,10 +1,60 @@
-async def create_analytics_indexes(db):
-    await db.event.create_index("created_at")
-    await db.event.create_index("event_name")
-    await db.event.create_index("event_category")
-    await db.event.create_index("user_id")
-    await db.event.create_index(
-        [("event_name", 1), ("created_at", -1)]
-    )
+import asyncio
+import logging
+
+from pymongo import ASCENDING, IndexModel
+from backend.api.analytic.analytic_service import event_partitions
+from backend.api.analytic.cohorts import ACTIVITY_INDEXES
+from backend.api.analytic.encoding import DICTIONARY_INDEXES
+from backend.api.analytic.live import LIVE_INDEXES
+from backend.api.analytic.sessions import open_session_indexes, session_indexes
+from backend.api.analytic.topk import topk_indexes
+from backend.api.user.user_cache import ensure_user_indexes
+from backend.utils.mongodb import ensure_collection_indexes
+from backend.utils.settings import get_settings
+
+log = logging.getLogger("analytic_server.db")
+
+# Index declarations per collection. Every index is named explicitly so
+# startup can compare against ``index_information()`` and skip the ones
+# that already exist instead of re-issuing createIndexes on every boot.
+# Event partitions get AnalyticsService.EVENT_INDEXES through
+# ``event_partitions`` when they are created.
+ANALYTICS_INDEXES: dict[str, list[IndexModel]] = {
+    "metric": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_1"),
+    ],
+    "event_dictionary": DICTIONARY_INDEXES,
+    "activity_bitmap": ACTIVITY_INDEXES,
+    "session": session_indexes(get_settings().EVENT_RETENTION_DAYS),
+    "session_open": open_session_indexes(get_settings().SESSION_IDLE_TIMEOUT_SECONDS),
+    "topk": topk_indexes(get_settings().EVENT_RETENTION_DAYS),
+    "live_counter": LIVE_INDEXES,
+}
 
-    await db.metric.create_index("created_at")
+# Indexes that used to be created and are now covered by a compound index
+# or no longer queried. Dropping them removes their write amplification on
+# every insert.
+REDUNDANT_INDEXES: dict[str, list[str]] = {
+    # Open synthetic sessions are looked up in session_open.
+    "session": ["u_1_end_-1"],
+}
+
+
+async def create_analytics_indexes(db) -> None:
+    """
+    Ensure all declared indexes, one collection per concurrent task.
+    """
+    results = await asyncio.gather(
+        *(
+            ensure_collection_indexes(db[name], indexes, REDUNDANT_INDEXES.get(name))
+            for name, indexes in ANALYTICS_INDEXES.items()
+        ),
+        ensure_user_indexes(db),
+        # Retention is left to the maintenance task, which archives first.
+        event_partitions.prepare(db),
+    )
+    created = [index for names in results[:-1] for index in names]
+    if created:
+        log.info("Created MongoDB indexes", extra={"indexes": created})
+    else:
+        log.info("MongoDB indexes already present")
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from fastapi import Depends, HTTPException, Request
+from backend.utils.mongodb import get_read_db, member_client
+
+log = logging.getLogger("analytic_server.query_guard")
+
+# (deadline on the monotonic clock, comment tagging the request's operations)
+_budget: contextvars.ContextVar[tuple[float, str] | None] = contextvars.ContextVar(
+    "query_budget", default=None
+)
+
+
+def _remaining_ms() -> int | None:
+    budget = _budget.get()
+    if budget is None:
+        return None
+    # Never 0: maxTimeMS=0 means "no limit" to MongoDB.
+    return max(1, int((budget[0] - time.monotonic()) * 1000))
+
+
+def query_options() -> dict:
+    """
+    ``maxTimeMS`` and ``comment`` for aggregate/count_documents calls made
+    under a QueryGuard; empty outside of one.
+    """
+    budget = _budget.get()
+    if budget is None:
+        return {}
+    return {"maxTimeMS": _remaining_ms(), "comment": budget[1]}
+
+
+def find_options() -> dict:
+    """Same as ``query_options`` with the keyword names ``find`` expects."""
+    budget = _budget.get()
+    if budget is None:
+        return {}
+    return {"max_time_ms": _remaining_ms(), "comment": budget[1]}
+
+
+async def kill_tagged_operations(db, comment: str) -> int:
+    """
+    killOp every in-flight operation carrying ``comment``. Opids are only
+    meaningful on the server that reported them, and reads may run on any
+    member, so each known server is asked for its own operations over a
+    direct connection and kills them itself.
+    """
+    killed = 0
+    for address in db.client.nodes:
+        admin = member_client(address).admin
+        try:
+            ops = await admin.aggregate([
+                {"$currentOp": {"allUsers": False, "idleSessions": False}},
+                {"$match": {"$or": [
+                    {"command.comment": comment},
+                    {"cursor.originatingCommand.comment": comment},
+                ]}},
+                {"$project": {"opid": 1}},
+            ]).to_list(length=None)
+            for op in ops:
+                await admin.command("killOp", op=op["opid"])
+        except Exception:
+            # An unreachable member must not keep the others from being cleaned up.
+            log.warning("Could not kill tagged operations on a server", extra={
+                "server": "%s:%s" % address
+            })
+            continue
+        killed += len(ops)
+    return killed
+
+
+class AggregationLimiter:
+    """
+    Caps concurrently running expensive queries. Requests beyond the cap
+    wait in a bounded queue for at most their remaining time budget.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.admitted = 0
+        self.wait_ms_total = 0.0
+
+    async def acquire(self, timeout: float) -> None:
+        if self._slots.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many concurrent analytics queries")
+        started = time.monotonic()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Timed out waiting for a query slot")
+        finally:
+            self.queued -= 1
+        self.active += 1
+        self.admitted += 1
+        self.wait_ms_total += (time.monotonic() - started) * 1000
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_ms_total / self.admitted, 2) if self.admitted else 0.0,
+        }
+
+
+class QueryGuard:
+    """
+    Dependency for read endpoints: gives the request a time budget that
+    bounds every MongoDB operation it makes (see ``query_options``), tags
+    those operations with a comment so they are killed if the client
+    disconnects, and optionally holds a ``limiter`` slot while it runs.
+    """
+
+    def __init__(self, budget_ms: int, limiter: AggregationLimiter | None = None):
+        self.budget_ms = budget_ms
+        self.limiter = limiter
+
+    async def _watch(self, request: Request, db, comment: str) -> None:
+        # The body has been read before dependencies run, so the next
+        # message is the disconnect (request.is_disconnected() polling cannot
+        # see it through BaseHTTPMiddleware).
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        try:
+            killed = await kill_tagged_operations(db, comment)
+        except Exception:
+            log.exception("Failed to kill queries of a disconnected client")
+            return
+        log.info("Client disconnected, killed its queries", extra={
+            "path": request.url.path,
+            "operations": killed
+        })
+
+    async def __call__(self, request: Request, db=Depends(get_read_db)):
+        # Time spent waiting for a slot comes out of the same budget.
+        deadline = time.monotonic() + self.budget_ms / 1000
+        if self.limiter is not None:
+            await self.limiter.acquire(timeout=deadline - time.monotonic())
+        # Set for the rest of the request's task; tasks it spawns inherit it.
+        comment = f"analytics:{uuid.uuid4().hex}"
+        _budget.set((deadline, comment))
+        watcher = asyncio.create_task(self._watch(request, db, comment))
+        try:
+            yield
+        finally:
+            watcher.cancel()
+            if self.limiter is not None:
+                self.limiter.release()
@@ -0,0 +1,188 @@
+import logging
+import math
+import time
+from fastapi import Depends, HTTPException, Response
+from backend.utils.auth import JWTBearer
+from backend.utils.cache import LRUCache
+from backend.utils.redis import get_redis
+
+log = logging.getLogger("analytic_server.rate_limit")
+
+# Refills a token bucket from the server clock, gives back the ARGV[4]
+# unspent tokens of the caller's previous lease and takes up to ARGV[3]
+# tokens. Returns the tokens granted and the tokens left (as a string,
+# Lua numbers are truncated to integers in replies).
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local returned = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate + returned)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {granted, tostring(tokens)}
+"""
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at", "leased", "granted", "next_lease", "lease_expires_at", "shared")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        # Tokens taken from the shared Redis bucket and not yet spent.
+        self.leased = 0
+        self.granted = 0
+        # Size of the next lease, grown while leases run out and shrunk to
+        # what was spent when they expire.
+        self.next_lease = 1
+        self.lease_expires_at = 0.0
+        self.shared = 0.0
+
+
+class RateLimiter:
+    """
+    Token bucket per key: ``rate`` tokens per second up to ``burst``.
+
+    Buckets live in process, so a request costs a dict lookup. When Redis
+    is configured the budget is shared by all workers instead: a process
+    leases up to ``lease`` tokens at a time from a bucket kept in Redis by
+    an atomic Lua script and spends them locally, so Redis sees one call
+    per lease rather than one per request. A lease starts at one token and
+    doubles while the worker spends it before it expires, up to ``lease``,
+    so a worker only holds tokens in proportion to its own traffic. Leases
+    expire after ``lease_seconds`` to bound how far a worker can run ahead;
+    unspent tokens are given back with the next lease. If Redis fails, the
+    in-process bucket is used until it answers again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        lease: int = 10,
+        lease_seconds: float = 1.0,
+        max_keys: int = 100_000
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.lease = max(1, min(lease, burst))
+        self.lease_seconds = lease_seconds
+        self.enabled = rate > 0 and burst > 0
+        self._buckets = LRUCache(max_keys)
+        self._script = None
+        self.allowed = 0
+        self.limited = 0
+        self.redis_errors = 0
+
+    def _bucket(self, key: str) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket(self.burst)
+            self._buckets.set(key, bucket)
+        return bucket
+
+    def _take_local(self, bucket: _Bucket) -> tuple[bool, float]:
+        now = time.monotonic()
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+        bucket.updated_at = now
+        if bucket.tokens < 1:
+            return False, bucket.tokens
+        bucket.tokens -= 1
+        return True, bucket.tokens
+
+    async def _take_shared(self, client, key: str, bucket: _Bucket) -> tuple[bool, float]:
+        now = time.monotonic()
+        if bucket.leased and bucket.lease_expires_at > now:
+            bucket.leased -= 1
+            return True, bucket.shared + bucket.leased
+        unspent = bucket.leased
+        if bucket.granted:
+            spent = bucket.granted - unspent
+            bucket.next_lease = min(self.lease, max(1, 2 * spent if not unspent else spent))
+        if self._script is None:
+            self._script = client.register_script(TAKE_SCRIPT)
+        granted, left = await self._script(
+            keys=[f"ratelimit:{self.name}:{key}"],
+            args=[self.rate, self.burst, bucket.next_lease, unspent]
+        )
+        bucket.shared = float(left)
+        bucket.granted = int(granted)
+        if not granted:
+            bucket.leased = 0
+            return False, bucket.shared
+        bucket.leased = bucket.granted - 1
+        bucket.lease_expires_at = now + self.lease_seconds
+        return True, bucket.shared + bucket.leased
+
+    async def take(self, key: str) -> tuple[bool, float]:
+        """Take one token for ``key``; returns (allowed, tokens left)."""
+        bucket = self._bucket(key)
+        client = get_redis()
+        if client is None:
+            allowed, left = self._take_local(bucket)
+        else:
+            try:
+                allowed, left = await self._take_shared(client, key, bucket)
+            except Exception:
+                self.redis_errors += 1
+                if self.redis_errors % 1000 == 1:
+                    log.exception("Shared rate limit unavailable, using the local bucket", extra={
+                        "limiter": self.name
+                    })
+                allowed, left = self._take_local(bucket)
+        if allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return allowed, left
+
+    def headers(self, left: float) -> dict[str, str]:
+        # Seconds until the bucket is full again.
+        reset = math.ceil((self.burst - left) / self.rate)
+        return {
+            "X-RateLimit-Limit": str(self.burst),
+            "X-RateLimit-Remaining": str(max(0, math.floor(left))),
+            "X-RateLimit-Reset": str(max(0, reset)),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "shared": get_redis() is not None,
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "redis_errors": self.redis_errors,
+        }
+
+
+class RateLimit:
+    """
+    Dependency spending one token of ``limiter`` for the token subject
+    (JWT ``sub``). Adds X-RateLimit-* headers and answers 429 with
+    Retry-After once the bucket is empty.
+    """
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    async def __call__(self, response: Response, token: dict = Depends(JWTBearer())) -> None:
+        if not self.limiter.enabled:
+            return
+        allowed, left = await self.limiter.take(token["sub"])
+        headers = self.limiter.headers(left)
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil((1 - left) / self.limiter.rate)))
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+        response.headers.update(headers)
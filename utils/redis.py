@@ -1,7 +1,33 @@
-import redis.asyncio as redis
+import logging
+from backend.utils.settings import get_settings
 
-redis_client = redis.Redis(
-    host="localhost",
-    port=6379,
-    decode_responses=True
-)
+log = logging.getLogger("analytic_server.redis")
+
+_client = None
+_missing = False
+
+
+def get_redis():
+    """
+    Shared client for REDIS_URL, created on first use. None when REDIS_URL
+    is empty or the redis package is not installed.
+    """
+    global _client, _missing
+    url = get_settings().REDIS_URL
+    if _client is None and url and not _missing:
+        # Imported here: redis is optional and slow to import.
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            log.warning("REDIS_URL is set but redis is not installed")
+            _missing = True
+            return None
+        _client = redis.Redis.from_url(url, decode_responses=True)
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+log = logging.getLogger("analytic_server.scheduler")
+
+
+class PeriodicTask:
+    """
+    Runs an async job every ``interval`` seconds until stopped.
+    Failures are logged and the job keeps its schedule.
+    """
+
+    def __init__(self, name: str, interval: float, job: Callable[[], Awaitable[None]]):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Periodic task failed", extra={"task": self.name})
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -20,6 +20,93 @@ class Settings:
         "analytic_server"
     )
 
+    # Separate pools: writes (ingestion) use the primary; analytics reads get
+    # their own pool and read preference. MONGO_READ_URI defaults to MONGO_URI.
+    MONGO_READ_URI: str = os.getenv("MONGO_READ_URI", "")
+    MONGO_WRITE_POOL_SIZE: int = int(os.getenv("MONGO_WRITE_POOL_SIZE", 50))
+    MONGO_READ_POOL_SIZE: int = int(os.getenv("MONGO_READ_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+    MONGO_READ_PREFERENCE: str = os.getenv("MONGO_READ_PREFERENCE", "secondaryPreferred")
+    # At least 90 (MongoDB minimum); -1 disables the staleness bound
+    MONGO_MAX_STALENESS_SECONDS: int = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", 120))
+    # Write concern of event inserts: "majority", or a number (0 = unacknowledged)
+    INGEST_WRITE_CONCERN: str = os.getenv("INGEST_WRITE_CONCERN", "1")
+
+    # Event partitions older than this are dropped (0 keeps them forever)
+    EVENT_RETENTION_DAYS: int = int(os.getenv("EVENT_RETENTION_DAYS", 0))
+    PARTITION_MAINTENANCE_SECONDS: int = int(os.getenv("PARTITION_MAINTENANCE_SECONDS", 3600))
+
+    # Idempotency-key de-duplication of ingested events
+    DEDUP_WINDOW_SECONDS: int = int(os.getenv("DEDUP_WINDOW_SECONDS", 86400))
+    DEDUP_CAPACITY: int = int(os.getenv("DEDUP_CAPACITY", 1_000_000))
+    DEDUP_ERROR_RATE: float = float(os.getenv("DEDUP_ERROR_RATE", 0.001))
+
+    # In-process columnar window of recent events (requires numpy)
+    HOT_WINDOW_ENABLED: bool = os.getenv("HOT_WINDOW_ENABLED", "false").lower() == "true"
+    HOT_WINDOW_DAYS: int = int(os.getenv("HOT_WINDOW_DAYS", 7))
+    HOT_WINDOW_SYNC_SECONDS: int = int(os.getenv("HOT_WINDOW_SYNC_SECONDS", 5))
+
+    # How often aggregates buffered at ingest (activity bitmaps, sessions)
+    # are written to MongoDB
+    INGEST_FLUSH_SECONDS: int = int(os.getenv("INGEST_FLUSH_SECONDS", 5))
+    SESSION_IDLE_TIMEOUT_SECONDS: int = int(os.getenv("SESSION_IDLE_TIMEOUT_SECONDS", 1800))
+
+    # Counters kept per field and hour by the heavy-hitter sketches
+    TOPK_CAPACITY: int = int(os.getenv("TOPK_CAPACITY", 1000))
+
+    # Ad-hoc queries: queryable metadata keys (comma separated), cost limits,
+    # and how many filters on a metadata key trigger an index on it
+    METADATA_QUERY_KEYS: set[str] = {
+        key.strip() for key in os.getenv("METADATA_QUERY_KEYS", "").split(",") if key.strip()
+    }
+    QUERY_MAX_TIME_MS: int = int(os.getenv("QUERY_MAX_TIME_MS", 5000))
+    QUERY_MAX_DOCS_EXAMINED: int = int(os.getenv("QUERY_MAX_DOCS_EXAMINED", 5_000_000))
+    METADATA_INDEX_THRESHOLD: int = int(os.getenv("METADATA_INDEX_THRESHOLD", 50))
+
+    # Live counters pushed over SSE
+    LIVE_PUSH_SECONDS: float = float(os.getenv("LIVE_PUSH_SECONDS", 1))
+    LIVE_KEEPALIVE_SECONDS: float = float(os.getenv("LIVE_KEEPALIVE_SECONDS", 15))
+    LIVE_MAX_SUBSCRIBERS: int = int(os.getenv("LIVE_MAX_SUBSCRIBERS", 1000))
+
+    # Response compression and conditional GETs
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+    COMPRESSION_OFFLOAD_BYTES: int = int(os.getenv("COMPRESSION_OFFLOAD_BYTES", 256 * 1024))
+    WATERMARK_REFRESH_SECONDS: float = float(os.getenv("WATERMARK_REFRESH_SECONDS", 1))
+    CONDITIONAL_GET_SLIDING_SECONDS: int = int(os.getenv("CONDITIONAL_GET_SLIDING_SECONDS", 60))
+
+    # User document cache (login, profile)
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", 10_000))
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+    # Cold tier: partitions older than ARCHIVE_AFTER_DAYS move to Parquet files
+    # under ARCHIVE_DIR (disabled when empty; needs pyarrow)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "")
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+
+    # Read time budgets (maxTimeMS across a request's MongoDB operations),
+    # overridable per endpoint with "name=ms,name=ms", and the cap on
+    # concurrently running expensive aggregations
+    QUERY_BUDGET_MS: int = int(os.getenv("QUERY_BUDGET_MS", 10_000))
+    QUERY_BUDGETS_MS: dict[str, int] = {
+        name.strip(): int(ms)
+        for name, _, ms in (
+            item.partition("=") for item in os.getenv("QUERY_BUDGETS_MS", "").split(",") if item.strip()
+        )
+    }
+    QUERY_MAX_CONCURRENT: int = int(os.getenv("QUERY_MAX_CONCURRENT", 8))
+    QUERY_MAX_QUEUED: int = int(os.getenv("QUERY_MAX_QUEUED", 32))
+
+    # Fraction of events read by approx=true counts, groupings and timeseries
+    APPROX_SAMPLE_RATE: float = float(os.getenv("APPROX_SAMPLE_RATE", 0.01))
+
+    # Token buckets per JWT subject (requests per second, burst; 0 disables),
+    # shared by all workers through Redis when REDIS_URL is set
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    RATE_LIMIT_INGEST_PER_SECOND: float = float(os.getenv("RATE_LIMIT_INGEST_PER_SECOND", 200))
+    RATE_LIMIT_INGEST_BURST: int = int(os.getenv("RATE_LIMIT_INGEST_BURST", 1000))
+    RATE_LIMIT_QUERY_PER_SECOND: float = float(os.getenv("RATE_LIMIT_QUERY_PER_SECOND", 5))
+    RATE_LIMIT_QUERY_BURST: int = int(os.getenv("RATE_LIMIT_QUERY_BURST", 30))
+
     # App metadata
     APP_NAME: str = "Analytics Server"
     ENV: str = os.getenv("ENV", "local")
@@ -0,0 +1,32 @@
+import time
+import logging
+from contextlib import asynccontextmanager
+
+log = logging.getLogger("analytic_server.startup")
+
+
+class StartupReport:
+    """
+    Records how long each lifespan step takes, so cold start can be measured
+    and exposed through the readiness probe.
+    """
+
+    def __init__(self) -> None:
+        self.started_at: float = time.perf_counter()
+        self.steps: dict[str, float] = {}
+        self.total_ms: float | None = None
+
+    @asynccontextmanager
+    async def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    def finish(self) -> None:
+        self.total_ms = round((time.perf_counter() - self.started_at) * 1000, 2)
+        log.info("Startup completed", extra={"total_ms": self.total_ms, "steps": self.steps})
+
+    def as_dict(self) -> dict:
+        return {"total_ms": self.total_ms, "steps": self.steps}